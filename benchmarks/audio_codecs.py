@@ -0,0 +1,76 @@
+"""Checks audio_codecs.yml against the golden release names and times the classifier.
+
+    python3 benchmarks/audio_codecs.py [--rounds N]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+import yaml
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from jellybean.audio_codecs import AudioCodecClassifier  # noqa: E402
+
+
+def load_golden():
+    with open(os.path.join(root, 'benchmarks', 'audio_codecs_golden.yml'), 'r') as file:
+        return yaml.safe_load(file)['files']
+
+
+def check_golden(classifier, golden):
+    failures = 0
+    for entry in golden:
+        codec = classifier.classify(entry['path'])
+        if codec != entry['codec']:
+            print(f"MISMATCH {entry['path']}: expected {entry['codec']}, got {codec}")
+            failures += 1
+    print(f"Golden set: {len(golden) - failures}/{len(golden)} match")
+    return failures == 0
+
+
+def raw_search(rules, path):
+    # What check_audio() used to do on every call
+    for rule in rules:
+        if re.search(rule['value'], path):
+            return rule['key']
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    rules_path = os.path.join(root, 'audio_codecs.yml')
+    with open(rules_path, 'r') as file:
+        rules = yaml.safe_load(file)['regex']
+    golden = load_golden()
+    paths = [entry['path'] for entry in golden]
+
+    if not check_golden(AudioCodecClassifier.from_file(rules_path), golden):
+        sys.exit(1)
+
+    def uncached():
+        classifier = AudioCodecClassifier(rules)
+        for path in paths:
+            classifier.classify(path)
+
+    cached = AudioCodecClassifier(rules)
+    cached.classify_many(paths)
+
+    timings = {
+        're.search per call': lambda: [raw_search(rules, path) for path in paths],
+        'compiled': uncached,
+        'compiled + memoized': lambda: cached.classify_many(paths),
+    }
+    for name, func in timings.items():
+        seconds = timeit.timeit(func, number=args.rounds)
+        print(f"{name:>22}: {seconds / (args.rounds * len(paths)) * 1e6:8.2f} us/path")
+
+
+if __name__ == '__main__':
+    main()
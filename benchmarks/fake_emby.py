@@ -0,0 +1,572 @@
+"""A local stand-in for the parts of the Emby API that run.py uses.
+
+It generates a synthetic library with real JPEG artwork and counts requests and bytes per endpoint,
+so overlay and restore runs can be exercised and measured without a real server.
+
+    python3 benchmarks/fake_emby.py --movies 10000 --series 2000 --episodes 10 --latency 0.01
+
+Point EMBY_URL at it and use the library names "Movies - 4K" and "TV Shows - 4K" in config.yaml.
+GET /__stats returns the request and byte counters and GET /__reset clears them.
+"""
+import argparse
+import base64
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image, ImageDraw
+
+user_id = 'fakeadmin'
+movies_view = {'Name': 'Movies - 4K', 'Id': 'view-movies', 'CollectionType': 'movies'}
+tvshows_view = {'Name': 'TV Shows - 4K', 'Id': 'view-tvshows', 'CollectionType': 'tvshows'}
+
+# (release name, video range, extended video type, Dolby Vision profile, audio codec, audio profile, channel layout)
+releases = [
+    ('2160p.UHD.BluRay.REMUX.DV.HDR.HEVC.TrueHD.7.1.Atmos-FGT', 'HDR', 'DolbyVision', 'DoviProfile76', 'truehd', 'Dolby TrueHD + Dolby Atmos', '7.1'),
+    ('2160p.UHD.BluRay.x265.HDR.DTS-HD.MA.5.1-SWTYBLZ', 'HDR', 'Hdr10', None, 'dts', 'DTS-HD MA', '5.1'),
+    ('2160p.BluRay.REMUX.HEVC.DTS-X.7.1-FGT', 'SDR', 'None', None, 'dts', 'DTS:X', '7.1'),
+    ('2160p.WEB-DL.DDP5.1.Atmos.DV.HEVC-CMRG', 'HDR', 'DolbyVision', 'DoviProfile50', 'eac3', 'Dolby Digital Plus + Dolby Atmos', '5.1'),
+    ('2160p.HMAX.WEB-DL.DD+5.1.Atmos.HDR10Plus.H.265-TEPES', 'HDR', 'Hdr10Plus', None, 'eac3', 'Dolby Digital Plus + Dolby Atmos', '5.1'),
+    ('2160p.AMZN.WEB-DL.DDP5.1.HDR.HEVC-NTb', 'HDR', 'Hdr10', None, 'eac3', None, '5.1'),
+    ('2160p.UHD.BluRay.x265.SDR.DTS.5.1-SWTYBLZ', 'SDR', 'None', None, 'dts', None, '5.1'),
+    ('2160p.UHD.BluRay.REMUX.HDR.HEVC.FLAC.1.0-EPSiLON', 'HDR', 'Hdr10', None, 'flac', None, 'mono'),
+    ('2160p.WEB-DL.AAC.2.0.H.265-GROUP', 'SDR', 'None', None, 'aac', 'LC', 'stereo'),
+    ('1080p.BluRay.x264.DTS-HD.MA.5.1-GROUP', 'SDR', 'None', None, 'dts', 'DTS-HD MA', '5.1'),
+]
+
+image_sizes = {'primary': (1000, 1500), 'backdrop': (3840, 2160), 'episode': (1920, 1080)}
+
+
+def make_jpeg(size, seed, quality=90):
+    """Artwork with enough structure that it compresses like a real poster."""
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    step = max(size[0] // 12, 1)
+    for index in range(0, size[0] + size[1], step):
+        colour = ((seed * 67 + index) % 256, (seed * 29 + index * 3) % 256, (seed * 13 + index * 7) % 256)
+        draw.line([(index, 0), (index - size[1], size[1])], fill=colour, width=step // 2)
+    noise = Image.effect_noise(size, 40).convert('RGB')
+    image = Image.blend(image, noise, 0.15)
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=quality)
+    return output.getvalue()
+
+
+def media_sources(name, release, width):
+    path, video_range, extended_type, dolby_vision_profile, codec, profile, layout = release
+    channels = {'7.1': 8, '5.1': 6, 'stereo': 2, 'mono': 1}[layout]
+    return [{
+        'Id': hashlib.md5(name.encode()).hexdigest(),
+        'Path': f'/media/{name}/{name}.{path}.mkv',
+        'Container': 'mkv',
+        'MediaStreams': [
+            {'Type': 'Video', 'Index': 0, 'Codec': 'hevc', 'Width': width, 'Height': width * 9 // 16,
+             'VideoRange': video_range, 'ExtendedVideoType': extended_type,
+             'ExtendedVideoSubType': dolby_vision_profile or 'None',
+             'DisplayTitle': f"{'4K' if width >= 2500 else '1080p'} {video_range} HEVC"},
+            {'Type': 'Audio', 'Index': 1, 'Codec': codec, 'Profile': profile, 'ChannelLayout': layout,
+             'Channels': channels, 'IsDefault': True,
+             'DisplayTitle': f"{profile or codec.upper()} {layout}"},
+        ],
+    }]
+
+
+class FakeEmby:
+    """A threaded HTTP server holding a synthetic library.
+
+    latency is added to every request. With store_uploads=False uploaded images are counted and
+    tagged but their bytes are dropped, which keeps memory flat for very large libraries. error_rate
+    answers that share of requests with a 503, and more than max_concurrent requests at once get a
+    429 with a Retry-After header, to exercise the client's retries and throttling.
+    """
+
+    def __init__(self, movies=100, series=20, episodes=8, latency=0.0, host='127.0.0.1', port=0,
+                 store_uploads=True, artwork_variants=8, error_rate=0.0, max_concurrent=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.store_uploads = store_uploads
+        self.lock = threading.Lock()
+        self.items = {}
+        # {item_id: {image_type: [(tag, source), ...]}}, only backdrops ever hold more than one
+        self.images = {}
+        self.uploads = {}
+        # Items by ParentId and seasons and episodes by SeriesId, so no request scans the whole library
+        self.children = defaultdict(list)
+        self.series_items = defaultdict(list)
+        # Filtered library listings by query, the pages of one listing are sliced from the same list
+        self.listings = {}
+        self.scaled = {}
+        self.requests = defaultdict(int)
+        self.bytes_in = defaultdict(int)
+        self.bytes_out = defaultdict(int)
+        self._next_id = 1
+
+        self.artwork = {image_type: [make_jpeg(size, seed) for seed in range(artwork_variants)]
+                        for image_type, size in image_sizes.items()}
+
+        for index in range(movies):
+            self.add_movie()
+        for index in range(series):
+            self.add_series(episodes)
+
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-emby', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests.clear()
+            self.bytes_in.clear()
+            self.bytes_out.clear()
+
+    def stats(self):
+        backdrops = self.backdrop_count()
+        with self.lock:
+            return {'requests': dict(self.requests),
+                    'bytes_in': dict(self.bytes_in),
+                    'bytes_out': dict(self.bytes_out),
+                    'backdrops': backdrops}
+
+    # Library generation
+
+    def _new_id(self):
+        with self.lock:
+            item_id = str(self._next_id)
+            self._next_id += 1
+        return item_id
+
+    def _add_item(self, item, images=('primary', 'backdrop'), artwork=None):
+        item.setdefault('TagItems', [])
+        item['ImageTags'] = {}
+        item['BackdropImageTags'] = []
+        self.items[item['Id']] = item
+        self.images[item['Id']] = {}
+        self.listings.clear()
+        self.children[item['ParentId']].append(item)
+        if item.get('SeriesId'):
+            self.series_items[item['SeriesId']].append(item)
+        seed = int(item['Id'])
+        for image_type in images:
+            # Episode stills are 16:9 even though Emby calls them primary images
+            key = (artwork or {}).get(image_type, image_type)
+            variants = self.artwork[key]
+            self._set_image(item['Id'], image_type, ('artwork', key, seed % len(variants)))
+        if 'backdrop' in images and seed % 3 == 0:
+            # Some items have a second backdrop, uploads must not pile up behind it
+            self._set_image(item['Id'], 'backdrop', ('artwork', 'backdrop', (seed + 1) % len(self.artwork['backdrop'])),
+                            add=True)
+
+    def add_movie(self, name=None, release=None):
+        item_id = self._new_id()
+        name = name or f'Movie {item_id} ({1950 + int(item_id) % 75})'
+        release = release or releases[int(item_id) % len(releases)]
+        width = 3840 if release[0].startswith('2160p') else 1920
+        self._add_item({'Id': item_id, 'Name': name, 'Type': 'Movie', 'IsFolder': False,
+                        'ParentId': movies_view['Id'], 'Width': width, 'Height': width * 9 // 16,
+                        'Overview': f'Synthetic movie {item_id}.',
+                        'MediaSources': media_sources(name, release, width)})
+        return item_id
+
+    def add_series(self, episodes=8):
+        series_id = self._new_id()
+        name = f'Show {series_id}'
+        self._add_item({'Id': series_id, 'Name': name, 'Type': 'Series', 'IsFolder': True,
+                        'ParentId': tvshows_view['Id'], 'Overview': f'Synthetic series {series_id}.'})
+        release = releases[int(series_id) % len(releases)]
+        seasons = {}
+        for number in range(1, episodes + 1):
+            season = 1 + (number - 1) // 10
+            if season not in seasons:
+                seasons[season] = self.add_season(series_id, season)
+            self.add_episode(series_id, seasons[season], season, number, release)
+        return series_id
+
+    def add_season(self, series_id, season):
+        season_id = self._new_id()
+        self._add_item({'Id': season_id, 'Name': f'Season {season}', 'Type': 'Season', 'IsFolder': True,
+                        'ParentId': series_id, 'SeriesId': series_id, 'IndexNumber': season}, images=('primary',))
+        return season_id
+
+    def add_episode(self, series_id, season_id, season, number, release):
+        item_id = self._new_id()
+        name = f"{self.items[series_id]['Name']} S{season:02d}E{number:02d}"
+        width = 3840 if release[0].startswith('2160p') else 1920
+        self._add_item({'Id': item_id, 'Name': name, 'Type': 'Episode', 'IsFolder': False,
+                        'ParentId': season_id, 'SeriesId': series_id, 'SeasonId': season_id,
+                        'ParentIndexNumber': season, 'IndexNumber': number, 'Width': width,
+                        'MediaSources': media_sources(name, release, width)},
+                       images=('primary',), artwork={'primary': 'episode'})
+        return item_id
+
+    def replace_image(self, item_id, image_type='primary', seed=0):
+        """Simulate artwork being changed on the server."""
+        key = 'backdrop' if image_type == 'backdrop' else 'primary'
+        if self.items[item_id]['Type'] == 'Episode':
+            key = 'episode'
+        self._set_image(item_id, image_type, ('artwork', key, seed % len(self.artwork[key])))
+
+    def _set_image(self, item_id, image_type, source, add=False):
+        """Put an image on an item and return its tag. add=True appends a backdrop, as an upload does in Emby."""
+        tag = hashlib.md5(f'{item_id}/{image_type}/{source}/{time.time_ns()}'.encode()).hexdigest()
+        entries = self.images[item_id].setdefault(image_type, [])
+        if add and image_type == 'backdrop':
+            entries.append((tag, source))
+        else:
+            entries[:1] = [(tag, source)]
+        self._update_tags(item_id)
+        return tag
+
+    def _remove_image(self, item_id, image_type, index=0):
+        entries = self.images[item_id].get(image_type) or []
+        if index >= len(entries):
+            return False
+        tag, _ = entries.pop(index)
+        self.uploads.pop(tag, None)
+        if not entries:
+            del self.images[item_id][image_type]
+        self._update_tags(item_id)
+        return True
+
+    def _update_tags(self, item_id):
+        item = self.items[item_id]
+        images = self.images[item_id]
+        item['BackdropImageTags'] = [tag for tag, _ in images.get('backdrop', [])]
+        item['ImageTags'] = {image_type.capitalize(): entries[0][0] for image_type, entries in images.items()
+                             if image_type != 'backdrop'}
+
+    def backdrop_count(self):
+        with self.lock:
+            return sum(len(images.get('backdrop', [])) for images in self.images.values())
+
+    def image_bytes(self, item_id, image_type, max_width=None, max_height=None, index=0):
+        entries = self.images.get(item_id, {}).get(image_type) or []
+        if index >= len(entries):
+            return None
+        tag, source = entries[index]
+        if source[0] == 'upload':
+            data = self.uploads.get(tag)
+            if data is None:
+                data = self.artwork['episode' if self.items[item_id]['Type'] == 'Episode'
+                                    else 'backdrop' if image_type == 'backdrop' else 'primary'][0]
+        else:
+            data = self.artwork[source[1]][source[2]]
+        if max_width or max_height:
+            data = self._scaled(data, max_width, max_height)
+        return data
+
+    def _scaled(self, data, max_width, max_height):
+        key = (hashlib.md5(data).hexdigest(), max_width, max_height)
+        with self.lock:
+            if key in self.scaled:
+                return self.scaled[key]
+        image = Image.open(io.BytesIO(data))
+        image.thumbnail((int(max_width or image.width), int(max_height or image.height)))
+        output = io.BytesIO()
+        image.convert('RGB').save(output, 'JPEG', quality=90)
+        with self.lock:
+            self.scaled[key] = output.getvalue()
+        return self.scaled[key]
+
+    # Webhooks
+
+    def notify(self, webhook_url, item_id, event='library.new'):
+        """POST an Emby style webhook payload for an item, as a daemon would receive it."""
+        item = self.items[item_id]
+        body = json.dumps({'Event': event, 'Item': {'Id': item_id, 'Name': item['Name'], 'Type': item['Type']}})
+        request = urllib.request.Request(webhook_url, data=body.encode(), method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request) as response:
+            return response.status
+
+    # HTTP
+
+    def _project(self, item, fields):
+        projected = {key: item[key] for key in ('Id', 'Name', 'Type', 'IsFolder', 'ParentId', 'SeriesId',
+                                                'ImageTags', 'BackdropImageTags') if key in item}
+        for field in fields:
+            if field in item:
+                projected[field] = item[field]
+        return projected
+
+    def _query_items(self, query):
+        fields = [field for field in query.get('Fields', '').split(',') if field]
+        item_types = [item_type for item_type in query.get('IncludeItemTypes', '').split(',') if item_type]
+        ids = set(query['Ids'].split(',')) if query.get('Ids') else None
+        parent_id = query.get('ParentId')
+        recursive = query.get('Recursive', '').lower() == 'true'
+
+        if ids is not None:
+            return self._page(self._filter_items(ids, item_types, parent_id, recursive), query, fields)
+        key = (tuple(item_types), parent_id, recursive)
+        items = self.listings.get(key)
+        if items is None:
+            items = self.listings[key] = self._filter_items(ids, item_types, parent_id, recursive)
+        return self._page(items, query, fields)
+
+    def _filter_items(self, ids, item_types, parent_id, recursive):
+        if ids is not None:
+            candidates = [self.items[item_id] for item_id in sorted(ids) if item_id in self.items]
+        elif parent_id is not None:
+            candidates = list(self.children.get(parent_id, []))
+            if recursive and (not item_types or {'Season', 'Episode'} & set(item_types)):
+                for item in self.children.get(parent_id, []):
+                    candidates += self.series_items.get(item['Id'], [])
+        else:
+            candidates = list(self.items.values())
+
+        items = []
+        for item in candidates:
+            if item_types and item['Type'] not in item_types:
+                continue
+            if parent_id is not None:
+                in_parent = item['ParentId'] == parent_id
+                if recursive and not in_parent and item.get('SeriesId'):
+                    in_parent = self.items[item['SeriesId']]['ParentId'] == parent_id
+                if not in_parent:
+                    continue
+            items.append(item)
+        return items
+
+    def _page(self, items, query, fields):
+        start = int(query.get('StartIndex') or 0)
+        limit = query.get('Limit')
+        page = items[start:start + int(limit)] if limit else items[start:]
+        return {'Items': [self._project(item, fields) for item in page], 'TotalRecordCount': len(items)}
+
+    def _seasons(self, series_id, query):
+        fields = [field for field in query.get('Fields', '').split(',') if field]
+        seasons = [item for item in self.series_items.get(series_id, []) if item['Type'] == 'Season']
+        return self._page(seasons, query, fields)
+
+    def _episodes(self, series_id, query):
+        fields = [field for field in query.get('Fields', '').split(',') if field]
+        episodes = [item for item in self.series_items.get(series_id, []) if item['Type'] == 'Episode']
+        if query.get('Season'):
+            episodes = [item for item in episodes if item['ParentIndexNumber'] == int(query['Season'])]
+        if query.get('SeasonId'):
+            episodes = [item for item in episodes if item['SeasonId'] == query['SeasonId']]
+        return self._page(episodes, query, fields)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _route(self):
+                path = urlparse(self.path).path.rstrip('/')
+                endpoint = re.sub(r'/(\d+)(?=/|$)', '/{id}', path)
+                endpoint = re.sub(r'/Images/\w+', '/Images/{type}', endpoint)
+                return path, endpoint
+
+            def _reply(self, endpoint, status, body=b'', content_type='application/json', headers=None):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+                with fake.lock:
+                    fake.bytes_out[endpoint] += len(body)
+                    fake.active -= 1
+
+            def _control(self, path):
+                # Out of band endpoints for the benchmark, never counted
+                if path == '/__stats':
+                    body = json.dumps(fake.stats()).encode()
+                elif path == '/__reset':
+                    fake.reset_stats()
+                    body = b'{}'
+                else:
+                    return False
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return True
+
+            def _begin(self):
+                path, endpoint = self._route()
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                with fake.lock:
+                    fake.requests[f'{self.command} {endpoint}'] += 1
+                    fake.bytes_in[endpoint] += len(body) + len(self.path)
+                    fake.active += 1
+                    overloaded = fake.max_concurrent and fake.active > fake.max_concurrent
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if overloaded:
+                    with fake.lock:
+                        fake.requests['429'] += 1
+                    self._reply(endpoint, 429, b'Too many requests', 'text/plain', {'Retry-After': '1'})
+                    return None
+                if fake.error_rate and random.random() < fake.error_rate:
+                    with fake.lock:
+                        fake.requests['503'] += 1
+                    self._reply(endpoint, 503, b'Unavailable', 'text/plain')
+                    return None
+                return path, endpoint, body
+
+            def do_GET(self):
+                if self._control(urlparse(self.path).path):
+                    return
+                begun = self._begin()
+                if begun is None:
+                    return
+                path, endpoint, _ = begun
+                query = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+
+                if path == '/Users':
+                    return self._reply(endpoint, 200, [{'Id': user_id, 'Name': 'admin',
+                                                        'Policy': {'IsAdministrator': True}}])
+                if path == f'/Users/{user_id}/Views':
+                    return self._reply(endpoint, 200, {'Items': [movies_view, tvshows_view]})
+                if path in ('/Items', f'/Users/{user_id}/Items'):
+                    return self._reply(endpoint, 200, fake._query_items(query))
+
+                match = re.fullmatch(rf'/Users/{user_id}/Items/(\w+)', path)
+                if match:
+                    item = fake.items.get(match[1])
+                    return self._reply(endpoint, 200 if item else 404, item or b'')
+
+                match = re.fullmatch(r'/Shows/(\w+)/Seasons', path)
+                if match:
+                    return self._reply(endpoint, 200, fake._seasons(match[1], query))
+
+                match = re.fullmatch(r'/Shows/(\w+)/Episodes', path)
+                if match:
+                    return self._reply(endpoint, 200, fake._episodes(match[1], query))
+
+                match = re.fullmatch(r'/Items/(\w+)/Images', path)
+                if match:
+                    with fake.lock:
+                        images = [{'ImageType': image_type.capitalize(), 'ImageIndex': index, 'ImageTag': tag}
+                                  for image_type, entries in fake.images.get(match[1], {}).items()
+                                  for index, (tag, _) in enumerate(entries)]
+                    return self._reply(endpoint, 200, images)
+
+                match = re.fullmatch(r'/Items/(\w+)/Images/(\w+)(?:/(\d+))?', path)
+                if match:
+                    data = fake.image_bytes(match[1], match[2].lower(),
+                                            query.get('maxWidth'), query.get('maxHeight'), int(match[3] or 0))
+                    if data is None:
+                        return self._reply(endpoint, 404, b'Not found', 'text/plain')
+                    return self._reply(endpoint, 200, data, 'image/jpeg')
+
+                self._reply(endpoint, 404, b'Not found', 'text/plain')
+
+            def do_DELETE(self):
+                begun = self._begin()
+                if begun is None:
+                    return
+                path, endpoint, _ = begun
+                match = re.fullmatch(r'/Items/(\w+)/Images/(\w+)(?:/(\d+))?', path)
+                if not match or match[1] not in fake.items:
+                    return self._reply(endpoint, 404, b'Not found', 'text/plain')
+                with fake.lock:
+                    fake._remove_image(match[1], match[2].lower(), int(match[3] or 0))
+                self._reply(endpoint, 204)
+
+            def do_POST(self):
+                begun = self._begin()
+                if begun is None:
+                    return
+                path, endpoint, body = begun
+
+                match = re.fullmatch(r'/Items/(\w+)/Images/(\w+)', path)
+                if match:
+                    item_id, image_type = match[1], match[2].lower()
+                    if item_id not in fake.items:
+                        return self._reply(endpoint, 404, b'Not found', 'text/plain')
+                    try:
+                        data = base64.b64decode(body, validate=True)
+                    except ValueError:
+                        return self._reply(endpoint, 400, b'Invalid base64', 'text/plain')
+                    with fake.lock:
+                        # A backdrop upload is added next to the others, any other type is replaced
+                        tag = fake._set_image(item_id, image_type, ('upload', hashlib.md5(data).hexdigest()), add=True)
+                        if fake.store_uploads:
+                            fake.uploads[tag] = data
+                    return self._reply(endpoint, 204)
+
+                match = re.fullmatch(r'/Items/(\w+)', path)
+                if match and match[1] in fake.items:
+                    update = json.loads(body or b'{}')
+                    fake.items[match[1]]['TagItems'] = update.get('TagItems', [])
+                    return self._reply(endpoint, 204)
+
+                self._reply(endpoint, 404, b'Not found', 'text/plain')
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8096)
+    parser.add_argument('--movies', type=int, default=1000)
+    parser.add_argument('--series', type=int, default=100)
+    parser.add_argument('--episodes', type=int, default=8, help='episodes per series')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--webhook', help='daemon webhook URL to notify when --add-every adds a movie')
+    parser.add_argument('--add-every', type=float, help='add a new movie every N seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with a 503')
+    parser.add_argument('--max-concurrent', type=int, default=0,
+                        help='answer with a 429 and Retry-After when more requests than this are in flight')
+
+    parser.add_argument('--discard-uploads', action='store_true', help='count uploads without keeping their bytes')
+    args = parser.parse_args()
+
+    fake = FakeEmby(args.movies, args.series, args.episodes, args.latency, args.host, args.port,
+                    store_uploads=not args.discard_uploads, error_rate=args.error_rate,
+                    max_concurrent=args.max_concurrent).start()
+    print(f'Fake Emby with {len(fake.items)} items listening on {fake.url}', flush=True)
+    try:
+        while True:
+            if args.add_every:
+                time.sleep(args.add_every)
+                item_id = fake.add_movie()
+                print(f'Added movie {item_id}')
+                if args.webhook:
+                    fake.notify(args.webhook, item_id)
+            else:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
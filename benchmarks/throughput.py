@@ -0,0 +1,159 @@
+"""End-to-end throughput of run.py against the local fake Emby.
+
+Runs an overlay pass, a no-op rerun and a restore pass in a scratch directory and reports
+items/sec, requests per item, bytes transferred and peak RSS for each.
+
+    python3 benchmarks/throughput.py --movies 2000 --series 200 --episodes 8 --latency 0.005 --concurrency 8
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Same names as the views in fake_emby.py
+library_names = ('Movies - 4K', 'TV Shows - 4K')
+
+
+class FakeServer:
+    """Runs fake_emby.py in its own process, so its memory does not count towards run.py's peak RSS."""
+
+    def __init__(self, args):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(root, 'benchmarks', 'fake_emby.py'), '--port', '0', '--discard-uploads',
+             '--movies', str(args.movies), '--series', str(args.series), '--episodes', str(args.episodes),
+             '--latency', str(args.latency), '--error-rate', str(args.error_rate),
+             '--max-concurrent', str(args.max_concurrent)],
+            stdout=subprocess.PIPE, text=True)
+        self.url = self.process.stdout.readline().strip().rsplit(' ', 1)[-1]
+
+    def get(self, path):
+        with urllib.request.urlopen(f'{self.url}{path}') as response:
+            return json.load(response)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def prepare_workdir(workdir, fake, args, overlays):
+    with open(os.path.join(workdir, '.env'), 'w') as file:
+        file.write(f'EMBY_URL="{fake.url}"\nEMBY_API_KEY="benchmark"\n')
+    config = [f'concurrency: {args.concurrency}', f'library_concurrency: {args.library_concurrency}']
+    if args.processes is not None:
+        config.append(f'processes: {args.processes}')
+    if args.output_config:
+        # Output profiles to compare, the file holds what goes under output: in config.yaml
+        with open(args.output_config) as file:
+            config.append('output:')
+            config += [f'  {line}' for line in file.read().splitlines()]
+    config.append('libraries:')
+    for name, enabled in zip(library_names, (args.movies > 0, args.series > 0)):
+        config += [f'  {name}:',
+                   f'    enabled: {str(enabled).lower()}',
+                   f'    overlays: {str(overlays).lower()}',
+                   f'    seasons: {str(args.season_images).lower()}',
+                   f'    episodes: {str(args.episode_images).lower()}']
+    with open(os.path.join(workdir, 'config.yaml'), 'w') as file:
+        file.write('\n'.join(config) + '\n')
+
+
+def run_pass(name, workdir, fake, args, overlays, items):
+    prepare_workdir(workdir, fake, args, overlays)
+    fake.get('/__reset')
+
+    started = time.perf_counter()
+    command = [sys.executable, os.path.join(root, 'run.py')]
+    if args.workers > 1:
+        command += ['--workers', str(args.workers)]
+    process = subprocess.Popen(command, cwd=workdir,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    elapsed = time.perf_counter() - started
+
+    stats = fake.get('/__stats')
+    requests = sum(stats['requests'].values())
+    bytes_in = sum(stats['bytes_in'].values())
+    bytes_out = sum(stats['bytes_out'].values())
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+    return {'pass': name,
+            'exit_code': process.returncode,
+            'seconds': round(elapsed, 3),
+            'items': items,
+            'items_per_second': round(items / elapsed, 2) if elapsed else None,
+            'requests': requests,
+            'requests_per_item': round(requests / items, 2) if items else None,
+            'bytes_uploaded': bytes_in,
+            'bytes_downloaded': bytes_out,
+            'peak_rss_bytes': peak_rss,
+            'backdrops': stats['backdrops'],
+            'requests_by_endpoint': stats['requests']}
+
+
+def print_table(results):
+    print(f"{'pass':<10} {'items/s':>9} {'req/item':>9} {'MB up':>9} {'MB down':>9} {'peak RSS MB':>12} {'seconds':>9}")
+    for result in results:
+        print(f"{result['pass']:<10} {result['items_per_second']:>9} {result['requests_per_item']:>9} "
+              f"{result['bytes_uploaded'] / 1e6:>9.1f} {result['bytes_downloaded'] / 1e6:>9.1f} "
+              f"{result['peak_rss_bytes'] / 1e6:>12.1f} {result['seconds']:>9}")
+        if result['exit_code'] != 0:
+            print(f"  run.py exited with {result['exit_code']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--movies', type=int, default=500)
+    parser.add_argument('--series', type=int, default=50)
+    parser.add_argument('--episodes', type=int, default=8, help='episodes per series')
+    parser.add_argument('--season-images', action='store_true', help='also overlay season posters')
+    parser.add_argument('--episode-images', action='store_true', help='also overlay episode images')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests the server fails with a 503')
+    parser.add_argument('--max-concurrent', type=int, default=0, help='requests in flight before the server sends 429s')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--library-concurrency', type=int, default=1, help='libraries processed at the same time')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='shards run as separate processes by run.py --workers, peak RSS is then that of the largest one')
+    parser.add_argument('--output-config', help='YAML file with the output profiles to use, as in config.yaml')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory')
+    args = parser.parse_args()
+
+    fake = FakeServer(args)
+    workdir = tempfile.mkdtemp(prefix='jellybean-bench-')
+    shutil.copytree(os.path.join(root, 'assets', 'overlays'), os.path.join(workdir, 'assets', 'overlays'))
+    shutil.copy(os.path.join(root, 'audio_codecs.yml'), workdir)
+
+    items = args.movies + args.series
+    backdrops = fake.get('/__stats')['backdrops']
+    try:
+        results = [run_pass('overlay', workdir, fake, args, True, items),
+                   run_pass('rerun', workdir, fake, args, True, items),
+                   run_pass('restore', workdir, fake, args, False, items)]
+    finally:
+        fake.stop()
+        if args.keep:
+            print(f'Scratch directory: {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_table(results)
+    if results[-1]['backdrops'] != backdrops:
+        # Every overlaid backdrop has to be swapped for its original, not left next to it
+        print(f"The restore left {results[-1]['backdrops']} backdrops on the server, it started with {backdrops}.")
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'arguments': vars(args), 'results': results}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
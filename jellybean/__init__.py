@@ -0,0 +1,22 @@
+"""An overlay tool for Emby.
+
+    from jellybean import Jellybean
+
+    with Jellybean.from_environment() as client:
+        client.process_item_ids(['12345'])
+
+Importing the package has no side effects and loads nothing heavy, Jellybean and main are only
+imported on first use.
+"""
+
+__all__ = ['Jellybean', 'main']
+
+
+def __getattr__(name):
+    if name == 'Jellybean':
+        from .client import Jellybean
+        return Jellybean
+    if name == 'main':
+        from .cli import main
+        return main
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,46 @@
+import re
+import threading
+
+
+class AudioCodecClassifier:
+    """Picks the audio overlay for a media path from the ordered rules in audio_codecs.yml.
+
+    The rules are compiled once and results are memoized by path, the first matching rule wins.
+    """
+
+    def __init__(self, rules):
+        self.rules = [(rule["key"], re.compile(rule["value"])) for rule in rules]
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_file(cls, path='audio_codecs.yml'):
+        import yaml
+
+        with open(path, 'r') as file:
+            return cls(yaml.safe_load(file)['regex'])
+
+    def classify(self, path):
+        try:
+            key = self._cache[path]
+            self.hits += 1
+            return key
+        except KeyError:
+            pass
+
+        key = self._match(path)
+        with self._lock:
+            self._cache[path] = key
+            self.misses += 1
+        return key
+
+    def classify_many(self, paths):
+        return {path: self.classify(path) for path in paths}
+
+    def _match(self, path):
+        for key, regex in self.rules:
+            if regex.search(path):
+                return key
+        return None
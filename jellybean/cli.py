@@ -0,0 +1,140 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+
+from .shard import Shard
+
+package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_logging(log_file):
+    # Each run starts a fresh log, workers started by --workers each get their own
+    if os.path.isfile(log_file):
+        os.remove(log_file)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(threadName)s - %(message)s",
+        handlers=[
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ]
+    )
+
+    # Ensure the needed folders exist
+    if not os.path.exists('./logs'):
+        os.makedirs('./logs')
+
+    # Prepare logging
+    for file in os.listdir('./logs'):
+        if file.endswith('.log'):
+            os.remove(f'./logs/{file}')
+
+
+def load_config(path='config.yaml'):
+    import yaml
+
+    with open(path, "r") as file:
+        return yaml.safe_load(file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Overlay tool for Emby")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and overlay items as Emby reports them through webhooks")
+    parser.add_argument("--gc-originals", action="store_true",
+                        help="delete backed up originals no item refers to any more and exit")
+    parser.add_argument("--shard", metavar="I/N",
+                        help="only process the I-th of N deterministic slices of every library, e.g. 1/4")
+    parser.add_argument("--workers", type=int, metavar="N",
+                        help="run N shards as separate processes and merge their reports")
+    parser.add_argument("--merge-reports", nargs="+", metavar="REPORT",
+                        help="merge the JSON reports of shards run elsewhere into the configured report and exit")
+    parser.add_argument("--items", nargs="+", metavar="ID",
+                        help="only process these items, seasons and episodes are handled through their series")
+    args = parser.parse_args(argv)
+
+    if args.daemon and (args.shard or args.workers):
+        parser.error("--daemon can not be combined with --shard or --workers")
+    shard = None
+    if args.shard:
+        try:
+            shard = Shard.parse(args.shard)
+        except ValueError as error:
+            parser.error(str(error))
+
+    setup_logging(os.getenv("JELLYBEAN_LOG_FILE", "jellybean.log"))
+
+    if args.merge_reports:
+        merge_reports(args.merge_reports, load_config())
+        return
+    if args.gc_originals:
+        from .originals import OriginalsStore
+
+        removed, freed = OriginalsStore(index_path=load_config().get("state_file", "jellybean.db")).collect_garbage()
+        logging.info(f"Removed {removed} unreferenced originals, freed {freed / 1024 / 1024:.1f} MB.")
+        return
+    if args.workers:
+        run_workers(args.workers, load_config())
+        return
+
+    from .client import Jellybean
+
+    if shard:
+        logging.info(f"Processing shard {shard}.")
+    with Jellybean.from_environment(shard=shard) as client:
+        # A few items are composited in the worker threads, booting the process pool would take longer
+        client.start(render_pool=not args.items)
+        if args.daemon:
+            client.run_daemon()
+        elif args.items:
+            client.process_item_ids(args.items)
+            client.write_report()
+        else:
+            client.run_libraries()
+            client.write_report()
+
+
+def run_workers(count, config_vars):
+    # Every worker is a full run over its shard of every library, they only share the state database
+    shards = [Shard(index, count) for index in range(1, count + 1)]
+    logging.info(f"Starting {count} workers.")
+    log_file = os.getenv("JELLYBEAN_LOG_FILE", "jellybean.log")
+    python_path = os.pathsep.join(filter(None, [package_root, os.getenv("PYTHONPATH")]))
+    processes = [subprocess.Popen([sys.executable, '-m', 'jellybean', '--shard', str(worker_shard)],
+                                  env=dict(os.environ, PYTHONPATH=python_path,
+                                           JELLYBEAN_LOG_FILE=worker_shard.suffix(log_file)))
+                 for worker_shard in shards]
+    failed = [str(worker_shard) for worker_shard, process in zip(shards, processes) if process.wait() != 0]
+
+    json_path = (config_vars.get("report") or {}).get("json", "jellybean-report.json")
+    if json_path:
+        merge_reports([worker_shard.suffix(json_path) for worker_shard in shards
+                       if os.path.exists(worker_shard.suffix(json_path))], config_vars)
+    if failed:
+        logging.error(f"Shards {', '.join(failed)} did not finish, rerun them with --shard to resume where they stopped.")
+        sys.exit(1)
+
+
+def merge_reports(paths, config_vars):
+    from .metrics import Metrics, merge_summaries
+
+    report_config = config_vars.get("report") or {}
+    summaries = []
+    for path in paths:
+        with open(path, "r") as file:
+            summaries.append(json.load(file))
+    if not summaries:
+        logging.error("No shard reports to merge.")
+        return
+    summary = merge_summaries(summaries)
+
+    json_path = report_config.get("json", "jellybean-report.json")
+    if json_path:
+        Metrics().write_json(json_path, summary)
+        logging.info(f"Merged the reports of {len(summaries)} shards into {json_path}")
+    if report_config.get("prometheus"):
+        Metrics().write_prometheus(report_config["prometheus"], summary)
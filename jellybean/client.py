@@ -0,0 +1,1225 @@
+import base64
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import cached_property, partial
+
+import requests
+
+from .audio_codecs import AudioCodecClassifier
+from .media_info import MediaClassifier
+from .metrics import Metrics
+from .originals import OriginalsStore
+from .state import StateStore
+from .throttle import AdaptiveLimiter, ThrottledSession, uncertain_statuses
+
+# JPEG quality asked from the server for scaled downloads
+download_quality = 90
+
+# Library enumeration is paged and only asks for the fields the overlays need
+page_size = 500
+item_fields = "MediaSources,TagItems,ImageTags,BackdropImageTags,Width"
+season_fields = "TagItems,ImageTags"
+
+# Images overlaid per item type, seasons and episodes only have the one
+item_image_types = {'Season': ('primary',), 'Episode': ('primary',)}
+default_image_types = ('primary', 'thumb')
+
+
+class Base64Reader:
+    """File-like view of a buffer that base64 encodes it as the upload body is read."""
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.position = 0
+        self.len = 4 * ((len(self.data) + 2) // 3)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            end = len(self.data)
+        else:
+            # Whole 3 byte groups so the chunks concatenate into one valid base64 string
+            end = self.position + max(size // 4, 1) * 3
+        chunk = base64.b64encode(self.data[self.position:end])
+        self.position = min(end, len(self.data))
+        return chunk
+
+    def seek(self, offset):
+        # Offsets count encoded bytes, a retried upload seeks back to 0
+        self.position = offset // 4 * 3
+
+
+class Jellybean:
+    """Overlays the artwork of one Emby server, with everything a run needs hanging off one object.
+
+    Creating one does not touch the network or the disk. The admin user, the libraries, the audio
+    rules, the state database and the originals store are loaded the first time they are used, old
+    backups are moved into the store then, and the compositing processes only start with start(). Caches live as long as the client, so several
+    clients can work side by side in one process.
+    """
+
+    def __init__(self, server, api_key, config=None, user_id=None, shard=None,
+                 audio_rules='audio_codecs.yml', originals_root='./assets/originals'):
+        self.server = server
+        self.api_key = api_key
+        self.config = config or {}
+        self.shard = shard
+        self.audio_rules = audio_rules
+        self.originals_root = originals_root
+        if user_id:
+            self.user_id = user_id
+
+        # Keep the artwork at its own size instead of resizing it to the canvas, badges are scaled to fit
+        self.keep_source_resolution = bool(self.config.get("keep_source_resolution", False))
+
+        # One keep-alive connection pool shared by every request of the client, see configure_session()
+        self.session = ThrottledSession()
+        # Stage timings, request accounting and counters for the run report
+        self.metrics = Metrics()
+        self.session.hooks['response'].append(self.metrics.record_response)
+        self.configure_session()
+
+        # Per-run cache of item and episode lookups and of their classification, keyed by item ID
+        self.item_cache = {}
+        self.episodes_cache = {}
+        self.classification_cache = {}
+        self.cache_lock = threading.Lock()
+
+        # Compositing and JPEG encoding run in worker processes when enabled, see start_render_pool()
+        self.render_pool = None
+        # Originals are backed up by a single background writer while the overlay is rendered
+        self.backup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='backup')
+        # Seasons and episodes of a show get their own workers, the one holding the show waits on them
+        self.child_executor = ThreadPoolExecutor(max_workers=self.get_concurrency(), thread_name_prefix='episode')
+
+    @classmethod
+    def from_environment(cls, config_path='config.yaml', env_file='.env', **kwargs):
+        """Client for the server in .env, configured by config.yaml."""
+        import yaml
+        from dotenv import load_dotenv
+
+        load_dotenv(env_file)
+        with open(config_path, "r") as file:
+            config = yaml.safe_load(file)
+        logging.info(f"Loaded {config_path}:\n {config.get('libraries')}")
+        return cls(os.getenv('EMBY_URL'), os.getenv('EMBY_API_KEY'), config, **kwargs)
+
+    @cached_property
+    def user_id(self):
+        response = self.session.get(f"{self.server}/Users",
+                                    headers={"X-Emby-Token": self.api_key})
+        for user in response.json():
+            if user["Policy"]["IsAdministrator"]:
+                logging.info(f"Admin user ID: {user['Id']}")
+                return user["Id"]
+        raise RuntimeError(f"No administrator found on {self.server}.")
+
+    @cached_property
+    def libraries(self):
+        """The libraries of config.yaml as {name: {'parent_id': ..., 'collection_type': ...}}."""
+        response = self.session.get(f"{self.server}/Users/{self.user_id}/Views",
+                                    headers={"X-Emby-Token": self.api_key})
+
+        views = response.json()["Items"]
+
+        libraries_dict = {}
+
+        for library in self.config["libraries"]:
+
+            for view in views:
+                if view['Name'] == library:
+                    parent_id = view["Id"]
+                    logging.info(f"Parent ID: {parent_id}")
+                    collection_type = view["CollectionType"]
+                    logging.info(f'Collection Type: {collection_type}')
+                    break
+                else:
+                    parent_id = None
+                    collection_type = None
+
+            libraries_dict.update({library: {"parent_id": parent_id, "collection_type": collection_type}})
+
+        return libraries_dict
+
+    @cached_property
+    def audio_classifier(self):
+        return AudioCodecClassifier.from_file(self.audio_rules)
+
+    @cached_property
+    def media_classifier(self):
+        return MediaClassifier(self.audio_classifier)
+
+    @cached_property
+    def state_store(self):
+        return StateStore(self.config.get("state_file", "jellybean.db"))
+
+    @cached_property
+    def originals(self):
+        # The index of the store lives in the state database next to the overlay rows
+        store = OriginalsStore(self.originals_root, self.config.get("state_file", "jellybean.db"))
+        # Backups from before the store have to be in it before the first one is looked up
+        store.migrate()
+        return store
+
+    @cached_property
+    def output_profiles(self):
+        from .render import get_output_profiles
+
+        return get_output_profiles(self.config.get("output"))
+
+    @cached_property
+    def overlay_signature(self):
+        return self.get_overlay_signature()
+
+    def start(self, render_pool=True):
+        """Get ready for a run: start the compositing processes and move old backups into the store.
+
+        A handful of items is not worth booting a process per CPU for, render_pool=False leaves the
+        compositing in the worker threads. Without start() the backups are moved when the store is
+        first used.
+        """
+        if render_pool:
+            self.start_render_pool()
+        # Opening the store moves the old backups into it
+        self.originals
+
+    def close(self):
+        if self.render_pool is not None:
+            self.render_pool.shutdown()
+            self.render_pool = None
+        self.backup_executor.shutdown()
+        self.child_executor.shutdown()
+        for name in ('state_store', 'originals'):
+            if name in self.__dict__:
+                self.__dict__.pop(name).close()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def configure_session(self):
+        pool_size = self.get_concurrency()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        http_config = self.config.get("http") or {}
+        self.session.timeout = http_config.get("timeout", 60)
+        self.session.retries = int(http_config.get("retries", 5))
+        self.session.backoff = float(http_config.get("backoff", 1))
+        self.session.limiter = AdaptiveLimiter(pool_size,
+                                               requests_per_second=float(http_config.get("max_requests_per_second") or 0),
+                                               adaptive=http_config.get("adaptive", True))
+
+    def get_item(self, item_id):
+        with self.cache_lock:
+            if item_id in self.item_cache:
+                self.metrics.count('item_cache_hits')
+                return self.item_cache[item_id]
+        self.metrics.count('item_cache_misses')
+
+        response = self.session.get(f"{self.server}/Users/{self.user_id}/Items/{item_id}",
+                                    headers={"X-Emby-Token": self.api_key})
+        item = response.json()
+
+        with self.cache_lock:
+            return self.item_cache.setdefault(item_id, item)
+
+    def cache_item(self, item):
+        with self.cache_lock:
+            self.item_cache[item['Id']] = item
+
+    def get_episodes(self, series_id, season_id=None):
+        # Only the first episode is used to classify a show or a season, so that is all we ask for
+        key = season_id or series_id
+        with self.cache_lock:
+            if key in self.episodes_cache:
+                self.metrics.count('episodes_cache_hits')
+                return self.episodes_cache[key]
+        self.metrics.count('episodes_cache_misses')
+
+        response = self.session.get(f"{self.server}/Shows/{series_id}/Episodes",
+                                    headers={"X-Emby-Token": self.api_key},
+                                    params={"UserId": self.user_id,
+                                            "SeasonId": season_id,
+                                            "Fields": item_fields,
+                                            "Limit": 1})
+        episodes = response.json()['Items']
+
+        with self.cache_lock:
+            return self.episodes_cache.setdefault(key, episodes)
+
+    def get_seasons(self, series_id):
+        response = self.session.get(f"{self.server}/Shows/{series_id}/Seasons",
+                                    headers={"X-Emby-Token": self.api_key},
+                                    params={"UserId": self.user_id,
+                                            "Fields": season_fields})
+        return response.json()['Items']
+
+    def get_season_episodes(self, series_id, season_id, limit=None):
+        # Paged so a season of a long running show never arrives as one huge response
+        episodes = []
+        while limit is None or len(episodes) < limit:
+            started = time.perf_counter()
+            response = self.session.get(f"{self.server}/Shows/{series_id}/Episodes",
+                                        headers={"X-Emby-Token": self.api_key},
+                                        params={"UserId": self.user_id,
+                                                "SeasonId": season_id,
+                                                "Fields": item_fields,
+                                                "StartIndex": len(episodes),
+                                                "Limit": min(page_size, limit or page_size)})
+            page = response.json()['Items']
+            self.metrics.record_stage('enumerate', time.perf_counter() - started)
+            episodes.extend(page)
+            if len(page) < page_size:
+                return episodes
+        return episodes
+
+    def get_media_file(self, item):
+        media_file = self.get_item(item['Id'])
+
+        # Check if media_file has "Type": "Series"
+        if media_file["Type"] == "Series":
+            logging.info("Media file is a TV show, getting the first episode")
+            media_file = self.get_episodes(media_file['Id'])[0]
+        elif media_file["Type"] == "Season":
+            media_file = self.get_episodes(media_file['SeriesId'], media_file['Id'])[0]
+        return media_file
+
+    def evict_item(self, item_id):
+        with self.cache_lock:
+            self.item_cache.pop(item_id, None)
+            self.episodes_cache.pop(item_id, None)
+            self.classification_cache.pop(item_id, None)
+
+    def clear_cache(self):
+        with self.cache_lock:
+            self.item_cache.clear()
+            self.episodes_cache.clear()
+            self.classification_cache.clear()
+
+    def save_original(self, item_id, image_type, data):
+        # Backups are written in the background, the store only indexes them once they are on disk
+        return self.backup_executor.submit(self.originals.save, item_id, image_type, data)
+
+    def write_report(self):
+        report_config = self.config.get("report") or {}
+        self.metrics.count('audio_cache_hits', self.audio_classifier.hits)
+        self.metrics.count('audio_cache_misses', self.audio_classifier.misses)
+        self.metrics.count('http_retries', self.session.retried)
+        self.audio_classifier.hits = self.audio_classifier.misses = self.session.retried = 0
+        if self.session.limiter:
+            self.metrics.count('http_limit_decreases', self.session.limiter.decreases)
+            self.session.limiter.decreases = 0
+        self.metrics.count('originals_deduplicated', self.originals.deduplicated)
+        self.originals.deduplicated = 0
+
+        json_path = report_config.get("json", "jellybean-report.json")
+        if json_path and self.shard:
+            # A shard only writes its part, --workers or --merge-reports writes the report of the whole run
+            json_path = self.shard.suffix(json_path)
+        if json_path:
+            self.metrics.write_json(json_path)
+            logging.info(f"Run report written to {json_path}")
+        if report_config.get("prometheus") and not self.shard:
+            self.metrics.write_prometheus(report_config["prometheus"])
+        self.metrics.reset()
+
+    def run_libraries(self, item_ids=None):
+        self.resume_unfinished()
+
+        library_concurrency = max(int(self.config.get("library_concurrency", 1) or 1), 1)
+        if library_concurrency <= 1:
+            for library in self.libraries:
+                self.run_library(library, item_ids)
+        else:
+            # Libraries share the HTTP session, so its limit on requests in flight covers all of them
+            with ThreadPoolExecutor(max_workers=library_concurrency, thread_name_prefix='library') as executor:
+                for future in [executor.submit(self.run_library, library, item_ids)
+                               for library in self.libraries]:
+                    future.result()
+        self.clear_cache()
+
+    def run_library(self, library, item_ids=None):
+        logging.info(f"Checking {library}")
+
+        library_type = self.libraries[library].get('collection_type')
+
+        items = self.get_all_items_library(self.libraries[library], item_ids)
+
+        if library_type == 'none':
+            logging.info(f"{library}: Library is not set to movies or tv shows, skipping library.")
+            return
+
+        if not self.config["libraries"][library]["enabled"]:
+            logging.info(
+                f"Library Name: {library} \nLibrary Type: {library_type}\nAction: Library is not enabled in the config.yaml file, skipping library.\n------")
+            return
+
+        logging.info(
+            f"Library Name: {library} \nLibrary Type: {library_type}\nAction: Library is enabled in the config.yaml file, checking overlays.\n------")
+        if self.shard:
+            items = (item for item in items if self.shard.owns(item))
+        # Only full passes are checkpointed, webhook batches are short enough to simply run again
+        self.overlays(library, library_type, items, checkpoint=item_ids is None)
+
+    def run_daemon(self):
+        from .daemon import EventQueue, start_webhook_server
+
+        daemon_config = self.config.get("daemon") or {}
+        reconcile_interval = daemon_config.get("reconcile_interval", 6 * 60 * 60)
+        retry_delay = daemon_config.get("retry_delay", 60)
+
+        queue = EventQueue(daemon_config.get("debounce", 10))
+        server = start_webhook_server(daemon_config.get("host", "127.0.0.1"), daemon_config.get("port", 8765), queue)
+
+        # Sweeps and webhook batches take turns on this thread, so they never work on the same item at once
+        next_sweep = time.monotonic()
+        try:
+            while True:
+                item_ids = queue.take_due(next_sweep - time.monotonic())
+                if item_ids:
+                    try:
+                        processed = self.process_item_ids(item_ids)
+                    except Exception:
+                        logging.exception(f"Unexpected error while processing {len(item_ids)} items from webhooks.")
+                        processed = False
+                    if not processed:
+                        # Emby may be restarting, the items are tried again later
+                        logging.warning(f"Retrying {len(item_ids)} items from webhooks in {retry_delay}s.")
+                        queue.add(item_ids, delay=retry_delay)
+                if time.monotonic() >= next_sweep:
+                    logging.info("Running reconciliation sweep.")
+                    try:
+                        self.run_libraries()
+                        self.write_report()
+                        next_sweep = time.monotonic() + reconcile_interval
+                    except Exception:
+                        logging.exception(f"Reconciliation sweep failed, running it again in {retry_delay}s.")
+                        next_sweep = time.monotonic() + min(retry_delay, reconcile_interval)
+        except KeyboardInterrupt:
+            logging.info("Stopping daemon.")
+        finally:
+            server.shutdown()
+
+    def process_item_ids(self, item_ids):
+        """Overlay the movies and shows behind item_ids. Returns False when Emby could not be asked for them."""
+        # Episodes and seasons carry the overlay on their series
+        response = self.session.get(f"{self.server}/Users/{self.user_id}/Items",
+                                    headers={"X-Emby-Token": self.api_key},
+                                    params={"Ids": ",".join(item_ids)})
+        if response.status_code != 200:
+            logging.error(f"Emby answered {response.status_code} when asked for items {', '.join(item_ids)}.")
+            return False
+        targets = set()
+        for item in response.json()["Items"]:
+            if item["Type"] in ("Movie", "Series"):
+                targets.add(item["Id"])
+            elif item["Type"] in ("Episode", "Season") and item.get("SeriesId"):
+                targets.add(item["SeriesId"])
+
+        if not targets:
+            return True
+        logging.info(f"Processing {len(targets)} items from webhooks.")
+        self.run_libraries(sorted(targets))
+        return True
+
+    def overlays(self, library, library_type, items, checkpoint=False):
+        overlay_config = self.config["libraries"][library]["overlays"]
+
+        if overlay_config:
+            logging.info(f"{library}: Overlays is true in the config.yaml file, adding missing overlays.")
+        else:
+            logging.info(f"{library}: Overlays is false in the config.yaml file, removing overlays.")
+
+        if library_type == 'movies':
+            process_item = self.process_movie
+        elif library_type == 'tvshows':
+            library_config = self.config["libraries"][library]
+            process_item = partial(self.process_tv_show, seasons=bool(library_config.get("seasons", False)),
+                                   episodes=bool(library_config.get("episodes", False)))
+        else:
+            return
+
+        completed = set()
+        if checkpoint:
+            # Shards keep their own checkpoint, one finishing must not clear the progress of the others
+            checkpoint = (f"{library} shard {self.shard}" if self.shard else library, 'overlay' if overlay_config else 'restore')
+            completed = self.state_store.completed(*checkpoint)
+            if completed:
+                logging.info(f"{library}: Resuming an interrupted pass, {len(completed)} items are already done.")
+        items = (item for item in items if item['Id'] not in completed)
+
+        concurrency = self.get_concurrency()
+        count = 0
+
+        if concurrency <= 1:
+            for item in items:
+                self.run_item(process_item, item, overlay_config, checkpoint)
+                count += 1
+        else:
+            logging.info(f"{library}: Processing items with {concurrency} workers.")
+            # Only keep a couple of items per worker in flight so pages are consumed as they are processed
+            max_pending = concurrency * 2
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='worker') as executor:
+                pending = set()
+                for item in items:
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    pending.add(executor.submit(self.run_item, process_item, item, overlay_config, checkpoint))
+                    count += 1
+                wait(pending)
+
+        if checkpoint:
+            self.state_store.clear_completed(checkpoint[0])
+        logging.info(f"Processed {count} items in {library}")
+
+    def start_render_pool(self):
+        if self.render_pool is not None:
+            return
+
+        processes = self.config.get("processes")
+        if processes is None:
+            # Only worth it when several items are in flight at once
+            processes = os.cpu_count() if self.get_concurrency() > 1 else 0
+        if int(processes) <= 0:
+            return
+
+        # Workers come from a clean server process instead of a fork of this one, which may already run
+        # threads of its own or of whatever embeds the client
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        self.render_pool = ProcessPoolExecutor(max_workers=int(processes), mp_context=context)
+        # Boot them up front so the first items do not wait for the imports
+        for future in [self.render_pool.submit(int) for _ in range(int(processes))]:
+            future.result()
+        logging.info(f"Compositing images in {processes} processes.")
+
+    def get_concurrency(self):
+        concurrency = self.config.get("concurrency", 1)
+        try:
+            concurrency = int(concurrency)
+        except (TypeError, ValueError):
+            logging.error(f"Invalid concurrency value {concurrency!r} in config.yaml, using 1.")
+            return 1
+        return max(concurrency, 1)
+
+    def run_item(self, process_item, item, overlay_config, checkpoint=None):
+        # An item failing must not take the rest of the library down with it
+        self.cache_item(item)
+        try:
+            with self.metrics.stage('item'):
+                process_item(item, overlay_config)
+            if checkpoint:
+                self.state_store.mark_completed(*checkpoint, item['Id'])
+        except Exception:
+            self.metrics.count('items_failed')
+            logging.exception(f"Unexpected error while processing {item.get('Name')}: {item.get('Id')}")
+        finally:
+            self.evict_item(item['Id'])
+
+    def process_movie(self, item, overlay_config):
+        logging.info(f"Checking {item['Name']}: {item['Id']}")
+        movie = item
+
+        if not 'MediaSources' in movie:
+            logging.info(f"Movie {item['Name']} has no media sources, skipping.")
+            return
+
+        self.sync_overlays(item, overlay_config, self.check_tags(movie))
+
+    def process_tv_show(self, item, overlay_config, seasons=False, episodes=False):
+        tv_show = item
+
+        logging.info(f"Checking {item['Name']}: {tv_show['Id']}")
+
+        if seasons or episodes:
+            # The season batches also hold the episode the show is classified by, so they go first
+            self.process_seasons(tv_show, overlay_config, seasons, episodes)
+
+        try:
+            episodes = self.get_episodes(tv_show['Id'])
+        except (json.JSONDecodeError, requests.exceptions.JSONDecodeError):
+            logging.info(f"TV Show {item['Name']} has no episodes, skipping.")
+            return
+
+        if len(episodes) == 0:
+            logging.info(f"TV Show {item['Name']} has no episodes, skipping.")
+            return
+        episode = episodes[0]
+
+        if episode.get("Id") is None:
+            logging.info(f"TV Show {item['Name']} has no episodes, skipping.")
+            return
+
+        if not 'MediaSources' in episode:
+            logging.info(f"Episode {episode['Name']} has no media sources, skipping.")
+            return
+
+        self.sync_overlays(item, overlay_config, self.check_tags(tv_show))
+
+    def process_seasons(self, tv_show, overlay_config, seasons, episodes):
+        concurrency = self.get_concurrency()
+        # As in overlays(), only a couple of items per worker are in flight
+        max_pending = concurrency * 2
+        pending = set()
+
+        def run_child(child):
+            nonlocal pending
+            if concurrency <= 1:
+                self.run_item(self.process_child_item, child, overlay_config)
+                return
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            pending.add(self.child_executor.submit(self.run_item, self.process_child_item, child, overlay_config))
+
+        for season in self.get_seasons(tv_show['Id']):
+            # A season is classified by its first episode, the rest are only needed for their own images
+            season_episodes = self.get_season_episodes(tv_show['Id'], season['Id'], None if episodes else 1)
+            if not season_episodes:
+                continue
+
+            with self.cache_lock:
+                self.episodes_cache.setdefault(tv_show['Id'], season_episodes[:1])
+                self.episodes_cache[season['Id']] = season_episodes[:1]
+            if overlay_config and episodes:
+                self.classify_items(season_episodes)
+            if episodes:
+                logging.info(f"{tv_show['Name']}: {season['Name']} has {len(season_episodes)} episodes.")
+
+            if seasons:
+                run_child(season)
+            if episodes:
+                for episode in season_episodes:
+                    if 'MediaSources' in episode:
+                        run_child(episode)
+        # Waited for here so the show is not checkpointed before its seasons and episodes are done
+        wait(pending)
+
+    def process_child_item(self, item, overlay_config):
+        logging.info(f"Checking {item['Name']}: {item['Id']}")
+        self.sync_overlays(item, overlay_config, self.check_tags(item))
+
+    def sync_overlays(self, item, overlay_config, tagged):
+        if overlay_config:
+            if tagged:
+                sources = self.get_stale_sources(item)
+                if sources is None:
+                    self.metrics.count('items_unchanged')
+                    logging.info(f"{item['Name']} has an up to date custom overlay, skipping.")
+                    return
+                logging.info(f"{item['Name']} has an outdated custom overlay. Redoing overlay on {item['Name']}: {item['Id']}")
+            else:
+                sources = {image_type: 'server' for image_type in self.get_image_types(item)}
+                logging.info(
+                    f"{item['Name']} does not have a custom overlay. Adding overlay to {item['Name']}: {item['Id']}")
+            self.apply_overlays(item, sources, tagged)
+        else:
+            if not tagged:
+                logging.info(f"{item['Name']} does not have a custom overlay, skipping.")
+                return
+            logging.info(f"{item['Name']} has a custom overlay. Removing overlay from {item['Name']}: {item['Id']}")
+            self.restore_overlays(item)
+
+    def apply_overlays(self, item, sources, tagged, deleted=()):
+        tag = {'Name': 'custom-overlay'}
+
+        # Items without badges for their media never change, they stay out of the journal
+        if not self.has_overlay_assets(item):
+            return
+
+        # The plan goes into the journal before anything on the server changes
+        self.state_store.journal(item['Id'], '', 'overlay', 'started')
+        for image_type, source in sources.items():
+            self.state_store.journal(item['Id'], image_type, 'overlay', 'planned', source)
+
+        image_types = list(sources)
+        # On a tagged item a 'server' source is new artwork, so its backup has to be replaced as well
+        primary = self.add_overlay(item["Id"], item, image_types[0], sources[image_types[0]] == 'backup', tagged,
+                                   image_types[0] not in deleted)
+        if primary:
+            results = [primary] + [self.add_overlay(item["Id"], item, image_type, sources[image_type] == 'backup', tagged,
+                                                    image_type not in deleted)
+                                   for image_type in image_types[1:]]
+            if tagged:
+                updated_item = self.get_full_item(item['Id'])
+            else:
+                updated_item = self.update_tag(item, True, tag)
+                if updated_item is None:
+                    # Overlaid but not tagged, the journal has the next start redo it from the backups
+                    return
+            self.record_state(updated_item, results)
+            self.metrics.count('items_overlaid')
+        self.finish_journal(item)
+
+    def restore_overlays(self, item, restored=()):
+        tag = {'Name': 'custom-overlay'}
+
+        self.state_store.journal(item['Id'], '', 'restore', 'started')
+        if 'primary' not in restored and not self.remove_overlay(item["Id"], item, 'primary'):
+            self.finish_journal(item)
+            return
+        # Everything that was backed up goes back, including a backdrop that stood in for a missing thumb
+        image_types = self.originals.image_types(item['Id']) or self.get_image_types(item)
+        for image_type in image_types:
+            if image_type != 'primary' and image_type not in restored:
+                self.remove_overlay(item["Id"], item, image_type)
+        if self.update_tag(item, False, tag) is None:
+            return
+
+        # Backups are only dropped once the tag is gone, until then an interrupted restore can start over
+        for image_type in image_types:
+            self.originals.remove(item['Id'], image_type)
+        self.state_store.forget(item['Id'])
+        self.metrics.count('items_restored')
+        self.finish_journal(item)
+
+    def get_image_types(self, item):
+        return item_image_types.get(item.get('Type'), default_image_types)
+
+    def get_layout(self, item, image_type):
+        # Episode images are 16:9 stills, they get the thumb layout
+        if item.get('Type') == 'Episode' and image_type == 'primary':
+            return 'thumb'
+        return image_type
+
+    def finish_journal(self, item):
+        entry = self.state_store.unfinished_item(item['Id'])
+        if entry is None:
+            return
+        if any(image['step'] == 'deleted' for image in entry['images'].values()):
+            # The server is left without this image, the next start uploads it again from the backup
+            logging.error(f"{item['Name']} is missing an image after a failed upload, it will be repaired on the next run.")
+            return
+        self.state_store.finish(item['Id'])
+
+    def resume_unfinished(self):
+        """Repair the items a previous run was interrupted in the middle of, before anything else runs."""
+        unfinished = self.state_store.unfinished()
+        if not unfinished:
+            return
+        logging.info(f"Repairing {len(unfinished)} items left unfinished by the last run.")
+
+        for item_id, entry in unfinished.items():
+            response = self.session.get(f"{self.server}/Users/{self.user_id}/Items/{item_id}",
+                                        headers={"X-Emby-Token": self.api_key})
+            if response.status_code == 404:
+                logging.info(f"Item {item_id} no longer exists, dropping it from the journal.")
+                self.state_store.finish(item_id)
+                continue
+
+            item = response.json()
+            if self.shard and not self.shard.owns(item):
+                # Left to the shard the item belongs to
+                continue
+            self.cache_item(item)
+            try:
+                with self.metrics.stage('repair'):
+                    self.repair_item(item, entry)
+                self.metrics.count('items_repaired')
+            except Exception:
+                logging.exception(f"Unexpected error while repairing {item.get('Name')}: {item_id}")
+            finally:
+                self.evict_item(item_id)
+
+    def repair_item(self, item, entry):
+        images = entry['images']
+        steps = ', '.join(f"{image_type} {image['step']}" for image_type, image in images.items())
+        logging.info(f"Repairing {item['Name']}: {item['Id']}, its {entry['action']} stopped at {steps or 'the start'}")
+
+        if entry['action'] == 'restore':
+            self.restore_overlays(item, [image_type for image_type, image in images.items() if image['step'] == 'uploaded'])
+            return
+
+        sources = {}
+        # Primary first, as in a normal run
+        for image_type in sorted(images, key=lambda image_type: image_type != 'primary'):
+            # Once the backup is written the server copy may be gone or already overlaid
+            sources[image_type] = images[image_type]['source'] if images[image_type]['step'] == 'planned' else 'backup'
+        if 'backdrop' in sources and images.get('thumb', {}).get('step') == 'planned':
+            # The item has no thumb, the backdrop was used in its place
+            del sources['thumb']
+
+        if not sources:
+            self.state_store.finish(item['Id'])
+            return
+        if not self.has_overlay_assets(item):
+            # Nothing can be overlaid, an image left deleted keeps the entry for a later run
+            self.finish_journal(item)
+            return
+        # Images an interrupted run already deleted are uploaded without deleting another one
+        deleted = [image_type for image_type, image in images.items() if image['step'] == 'deleted']
+        self.apply_overlays(item, sources, self.check_tags(item), deleted)
+
+    def get_stale_sources(self, item):
+        """Work out which images of a tagged item need their overlay redone and where each original comes from.
+
+        Returns None when the overlay is up to date. Otherwise maps every image type to 'server' when the
+        artwork was replaced upstream, or 'backup' when only the media or the overlay config changed.
+        """
+        rows = self.state_store.get(item['Id'])
+
+        if 'primary' not in rows:
+            # Tagged before the state store existed, take the overlay on the server as current
+            self.adopt_state(item)
+            return None
+
+        sources = {'primary': 'backup'}
+        sources.update({image_type: 'backup' for image_type in rows if image_type != 'primary'})
+        if len(sources) == 1 and 'thumb' in self.get_image_types(item):
+            sources['thumb'] = 'server'
+
+        stale = False
+        for image_type, row in rows.items():
+            if image_type == 'backdrop':
+                # The overlaid backdrop is wherever Emby appended it, not necessarily the first one
+                changed = row['image_tag'] not in self.get_item_image_tags(item, image_type)
+            else:
+                changed = self.get_image_tag(item, image_type) != row['image_tag']
+            if changed:
+                logging.info(f"{item['Name']}: {image_type} image changed on the server.")
+                sources[image_type] = 'server'
+                stale = True
+
+        if rows['primary']['signature'] != self.overlay_signature:
+            logging.info(f"{item['Name']}: overlay configuration changed.")
+            stale = True
+        elif (self.check_hdr(item), self.check_audio(item)) != (rows['primary']['resolution'], rows['primary']['audio']):
+            logging.info(f"{item['Name']}: media classification changed.")
+            stale = True
+
+        return sources if stale else None
+
+    def adopt_state(self, item):
+        resolution = self.check_hdr(item)
+        audio = self.check_audio(item)
+        for image_type in ('primary', 'thumb', 'backdrop'):
+            image_tag = self.get_image_tag(item, image_type)
+            if image_tag is None:
+                continue
+            self.state_store.record(item['Id'], image_type, image_tag, resolution, audio, self.overlay_signature, None)
+            if image_type == 'thumb':
+                break
+
+    def record_state(self, updated_item, results):
+        for result in results:
+            if not result:
+                continue
+            image_tag = self.get_image_tag(updated_item, result['image_type'])
+            if result['image_type'] == 'backdrop':
+                # Emby appends an uploaded backdrop after the ones the item already had
+                added = [image_tag for image_tag in self.get_item_image_tags(updated_item, 'backdrop')
+                         if image_tag not in result['kept_tags']]
+                image_tag = added[-1] if added else image_tag
+            self.state_store.record(updated_item['Id'], result['image_type'], image_tag,
+                                    result['resolution'], result['audio'], self.overlay_signature, result['original_checksum'])
+
+    def get_image_tag(self, item, image_type):
+        if image_type == 'backdrop':
+            backdrop_tags = item.get('BackdropImageTags') or []
+            return backdrop_tags[0] if backdrop_tags else None
+        return (item.get('ImageTags') or {}).get(image_type.capitalize())
+
+    def get_item_image_tags(self, item, image_type):
+        # What the item says is on the server, in index order
+        if image_type == 'backdrop':
+            return list(item.get('BackdropImageTags') or [])
+        image_tag = (item.get('ImageTags') or {}).get(image_type.capitalize())
+        return [image_tag] if image_tag else []
+
+    def get_image_tags(self, movie_id, image_type):
+        response = self.session.get(f"{self.server}/Items/{movie_id}/Images",
+                                    headers={"X-Emby-Token": self.api_key})
+        images = [image for image in response.json() if str(image.get('ImageType')).lower() == image_type]
+        return [image.get('ImageTag') for image in sorted(images, key=lambda image: image.get('ImageIndex') or 0)]
+
+    def get_overlaid_index(self, movie_id, image_type, image_tags):
+        """Return the index of our overlaid image among image_tags, or None when it is not there.
+
+        Primary and thumb images are replaced in place. An uploaded backdrop is added after the
+        others, so the overlaid one is found by the tag recorded for it.
+        """
+        if not image_tags:
+            return None
+        if image_type != 'backdrop':
+            return 0
+        recorded = self.state_store.get(movie_id).get(image_type)
+        if recorded is None or recorded['image_tag'] is None:
+            # Nothing recorded, the overlay went on the first backdrop
+            return 0
+        if recorded['image_tag'] not in image_tags:
+            return None
+        return image_tags.index(recorded['image_tag'])
+
+    def image_url(self, movie_id, image_type, index):
+        # Backdrops are addressed by index, without one Emby takes the first
+        if image_type == 'backdrop':
+            return f"{self.server}/Items/{movie_id}/Images/{image_type}/{index}"
+        return f"{self.server}/Items/{movie_id}/Images/{image_type}"
+
+    def change_image(self, method, url, applied, **kwargs):
+        """Send the DELETE or POST of an image and return whether it went through.
+
+        The session does not repeat these after a read timeout, a dropped connection or a 500, 502
+        or 504, Emby may have acted on them anyway. A backdrop DELETE sent twice removes the next backdrop and an upload
+        sent twice adds a second one, so applied() asks the server first and the request is only
+        sent again when it did not happen.
+        """
+        for attempt in range(self.session.retries + 1):
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                outcome = error.__class__.__name__
+            else:
+                if response.status_code not in uncertain_statuses:
+                    if response.status_code >= 300:
+                        logging.info(f'Response: {response.text}')
+                    return response.status_code < 300
+                outcome = f"a {response.status_code}"
+                response.close()
+
+            if applied():
+                logging.info(f"{method} {url} ended with {outcome}, but Emby did it.")
+                return True
+            if attempt < self.session.retries:
+                delay = self.session.backoff_delay(attempt)
+                logging.warning(f"{method} {url} ended with {outcome} and did not happen, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                # Streamed bodies have to be read again from the start
+                data = kwargs.get('data')
+                if hasattr(data, 'seek'):
+                    data.seek(0)
+        logging.info(f"{method} {url} failed with {outcome}.")
+        return False
+
+    def get_overlay_signature(self):
+        from .render import image_layouts, badge_background_color, default_output_profile
+
+        # Changes whenever the badge layout or any of the overlay images change
+        digest = hashlib.sha1(repr((image_layouts, badge_background_color, self.keep_source_resolution)).encode())
+        # And with the output profiles, left out while they are the defaults so existing overlays stay current
+        if any(profile != default_output_profile for profile in self.output_profiles.values()):
+            digest.update(repr(sorted((layout, sorted(profile.items()))
+                                      for layout, profile in self.output_profiles.items())).encode())
+        for folder in ('resolution', 'audio'):
+            for name in sorted(os.listdir(f'./assets/overlays/{folder}')):
+                digest.update(f'{folder}/{name}'.encode())
+                with open(f'./assets/overlays/{folder}/{name}', 'rb') as file:
+                    digest.update(file.read())
+        return digest.hexdigest()
+
+    def get_all_items_library(self, library, item_ids=None):
+        if library['collection_type'] == 'movies':
+            item_types = "Movie"
+        else:
+            item_types = "Series"
+
+        start_index = 0
+        while True:
+            started = time.perf_counter()
+            response = self.session.get(f"{self.server}/Users/{self.user_id}/Items",
+                                        headers={"X-Emby-Token": self.api_key},
+                                        params={"ParentId": library["parent_id"],
+                                                "Recursive": "true",
+                                                "IncludeItemTypes": item_types,
+                                                "Fields": item_fields,
+                                                "Ids": ",".join(item_ids) if item_ids else None,
+                                                "StartIndex": start_index,
+                                                "Limit": page_size})
+            items = response.json()["Items"]
+            self.metrics.record_stage('enumerate', time.perf_counter() - started)
+
+            yield from items
+
+            if len(items) < page_size:
+                break
+            start_index += len(items)
+
+    def check_tags(self, file):
+        exists = any(item['Name'] == "custom-overlay" for item in file['TagItems'])
+        return exists
+
+    def classify_item(self, item):
+        """Resolution and audio overlay names of an item, worked out once per item and run."""
+        with self.cache_lock:
+            if item['Id'] in self.classification_cache:
+                return self.classification_cache[item['Id']]
+
+        media_file = self.get_media_file(item)
+        with self.metrics.stage('classify'):
+            resolution, audio, source = self.media_classifier.classify(media_file)
+        self.metrics.count(f'classified_from_{source}')
+        logging.info(f"Media file: {media_file['Name']} is {resolution} with {audio} audio, going by its {source}")
+
+        with self.cache_lock:
+            return self.classification_cache.setdefault(item['Id'], (resolution, audio))
+
+    def classify_items(self, items):
+        """Classify a batch of episodes up front from the streams they were listed with."""
+        items = [item for item in items if 'MediaSources' in item]
+        with self.metrics.stage('classify'):
+            results = {item['Id']: self.media_classifier.classify(item) for item in items}
+        for resolution, audio, source in results.values():
+            self.metrics.count(f'classified_from_{source}')
+
+        with self.cache_lock:
+            for item_id, (resolution, audio, source) in results.items():
+                self.classification_cache.setdefault(item_id, (resolution, audio))
+
+    def check_hdr(self, item):
+        return self.classify_item(item)[0]
+
+    def check_audio(self, item):
+        return self.classify_item(item)[1]
+
+    def get_full_item(self, item_id):
+        response = self.session.get(f"{self.server}/Users/{self.user_id}/Items/{item_id}",
+                                    headers={"X-Emby-Token": self.api_key})
+        return response.json()
+
+    def update_tag(self, item, add, tag):
+        with self.metrics.stage('update_tag'):
+            return self.write_tag(item, add, tag)
+
+    def write_tag(self, item, add, tag):
+        # Library items only carry a few fields, posting one back would wipe the rest of the metadata
+        movie = self.get_full_item(item['Id'])
+
+        if add:
+            movie["TagItems"].append(tag)
+        else:
+            for tags in movie['TagItems']:
+                if tags['Name'] == "custom-overlay":
+                    movie['TagItems'].remove(tags)
+                    break
+
+        response3 = self.session.post(f"{self.server}/Items/{item['Id']}",
+                                      headers={"X-Emby-Token": self.api_key,
+                                               "Content-Type": "application/json"},
+                                      data=json.dumps(movie), idempotent=True)
+
+        if response3.status_code == 204:
+            logging.info(f'Tag for {item["Name"]} updated successfully')
+        else:
+            logging.info(f'Failed to update tag for {item["Name"]}')
+            return None
+        return movie
+
+    def render_image(self, original_data, layout, resolution_overlay_name, audio_overlay_name):
+        """Return the overlaid image encoded with the output profile of its layout, and its content type."""
+        from .render import render_overlay
+
+        args = (original_data, layout, resolution_overlay_name, audio_overlay_name, self.keep_source_resolution,
+                self.output_profiles[layout])
+        started = time.perf_counter()
+        if self.render_pool is None:
+            output_data, content_type, timings, guarded = render_overlay(*args)
+        else:
+            # Worker threads wait here, so at most one image per worker is queued for the process pool
+            output_data, content_type, timings, guarded = self.render_pool.submit(render_overlay, *args).result()
+        for stage, seconds in timings.items():
+            self.metrics.record_stage(stage, seconds)
+        self.metrics.record_stage('render', time.perf_counter() - started)
+
+        # Per output profile, saved bytes are counted against the image the overlay was made from
+        self.metrics.record_stage(f'encode_{layout}', timings['encode'])
+        self.metrics.count(f'output_{layout}_bytes', len(output_data))
+        self.metrics.count(f'output_{layout}_bytes_saved', len(original_data) - len(output_data))
+        if guarded:
+            self.metrics.count(f'output_{layout}_guarded')
+        return output_data, content_type
+
+    def download_image(self, movie_id, image_type, scaled, layout=None):
+        from .render import image_layouts, fit_size
+
+        params = {}
+        if scaled and not self.keep_source_resolution:
+            # Have the server shrink the artwork to the size we output instead of sending the full image
+            layout = layout or image_type
+            width, height = fit_size(image_layouts[layout]['size'], self.output_profiles[layout]['max_dimension'])
+            params = {"maxWidth": width, "maxHeight": height, "quality": download_quality}
+        with self.metrics.stage('download'):
+            return self.session.get(f"{self.server}/Items/{movie_id}/Images/{image_type}",
+                                    headers={"X-Emby-Token": self.api_key},
+                                    params=params)
+
+    def has_overlay_assets(self, item):
+        # Check if the overlay file exists, before anything is downloaded
+        resolution_overlay_name = self.check_hdr(item)
+        audio_overlay_name = self.check_audio(item)
+        if not os.path.exists(f'./assets/overlays/resolution/{resolution_overlay_name}.png'):
+            logging.error(f"Overlay {resolution_overlay_name}.png does not exist, skipping.")
+            return False
+        if not os.path.exists(f'./assets/overlays/audio/{audio_overlay_name}.png'):
+            logging.error(f"Overlay {audio_overlay_name}.png does not exist, skipping.")
+            return False
+        return True
+
+    def add_overlay(self, movie_id, item, image_type, from_backup=False, refresh_backup=False, replace=True):
+        logging.info(f"Adding {image_type} overlay to {item['Name']}: {movie_id}")
+
+        # Both badges exist, apply_overlays() checked before anything was journaled
+        resolution_overlay_name = self.check_hdr(item)
+        audio_overlay_name = self.check_audio(item)
+
+        if from_backup:
+            # The server holds our composite, start again from the saved original
+            original_data = self.originals.load(movie_id, image_type)
+            if original_data is None:
+                logging.error(f"No backup of the {image_type} image for {item['Name']}, skipping.")
+                return False
+            # The key the original is stored under, the state row and the store share it
+            original_checksum = self.originals.digest(movie_id, image_type)
+        else:
+            response = self.session.get(f"{self.server}/Items/{movie_id}/Images",
+                                        headers={"X-Emby-Token": self.api_key})
+
+            image_data = response.json()
+
+            if len(image_data) == 0:
+                logging.info(f"Movie {item['Name']} has no poster, skipping.")
+                return False
+
+            # Full resolution is only needed when the original still has to be backed up
+            save_backup = refresh_backup or not self.originals.has(movie_id, image_type)
+            response = self.download_image(movie_id, image_type, not save_backup, self.get_layout(item, image_type))
+
+            if image_type == 'thumb' and response.status_code == 404:
+                logging.info(f"Movie {item['Name']} has no thumb, looking for backdrop.")
+                image_type = 'backdrop'
+                save_backup = refresh_backup or not self.originals.has(movie_id, image_type)
+                response = self.download_image(movie_id, image_type, not save_backup, self.get_layout(item, image_type))
+
+            if response.status_code != 200:
+                logging.info(f"{item['Name']} does not have a {image_type} image, skipping.")
+                return False
+
+            original_data = response.content
+            # A scaled download is not the original, keep whatever checksum the backup was recorded with.
+            # A new backup is recorded with the digest the store saves it under
+            original_checksum = None
+
+        # Save a copy of the original image, written while the overlay renders
+        backup = None
+        if not from_backup and save_backup:
+            backup = self.save_original(movie_id, image_type, original_data)
+
+        from PIL import UnidentifiedImageError
+
+        try:
+            output_data, content_type = self.render_image(original_data, self.get_layout(item, image_type),
+                                                          resolution_overlay_name, audio_overlay_name)
+        except (UnidentifiedImageError, OSError):
+            logging.error(f"Unable to open {image_type} image of {movie_id}, skipping.")
+            return False
+
+        # The original has to be safely on disk before the server copy is deleted
+        if backup is not None:
+            try:
+                original_checksum = backup.result()
+            except OSError:
+                logging.exception(f"Failed to save the original {image_type} image of {item['Name']}, skipping.")
+                return False
+        self.state_store.journal(movie_id, image_type, 'overlay', 'backed_up')
+
+        # A redone overlay replaces the previous one, a first one replaces the artwork it was made from
+        image_tags = self.get_item_image_tags(item, image_type)
+        index = self.get_overlaid_index(movie_id, image_type, image_tags) if replace else None
+        if index is None and replace and not from_backup:
+            index = 0
+        kept_tags = image_tags[:index] + image_tags[index + 1:] if index is not None else image_tags
+
+        def deleted():
+            current = self.get_image_tags(movie_id, image_type)
+            return image_tags[index] not in current if image_tags else not current
+
+        def uploaded():
+            return any(image_tag not in kept_tags for image_tag in self.get_image_tags(movie_id, image_type))
+
+        with self.metrics.stage('upload'):
+            if index is not None:
+                self.change_image('DELETE', self.image_url(movie_id, image_type, index), deleted,
+                                  headers={"X-Emby-Token": self.api_key})
+            self.state_store.journal(movie_id, image_type, 'overlay', 'deleted')
+
+            # Upload the new image to the server
+            headers = {"X-Emby-Token": self.api_key,
+                       "Content-Type": content_type}
+            url = f"{self.server}/Items/{movie_id}/Images/{image_type}/"
+
+            success = self.change_image('POST', url, uploaded, headers=headers, data=Base64Reader(output_data))
+
+        if success:
+            logging.info('Image uploaded successfully')
+            self.state_store.journal(movie_id, image_type, 'overlay', 'uploaded')
+            return {'image_type': image_type,
+                    'resolution': resolution_overlay_name,
+                    'audio': audio_overlay_name,
+                    'original_checksum': original_checksum,
+                    'kept_tags': kept_tags}
+        else:
+            logging.info('Failed to upload image')
+            return False
+
+    def remove_overlay(self, movie_id, item, image_type):
+        response = self.session.get(f"{self.server}/Items/{movie_id}/Images",
+                                    headers={"X-Emby-Token": self.api_key})
+
+        image_data = response.json()
+
+        if len(image_data) == 0:
+            # print(f"Movie {item['Name']} has no poster, skipping.")
+            return False
+
+        image_tags = [image.get('ImageTag') for image in sorted(image_data, key=lambda image: image.get('ImageIndex') or 0)
+                      if str(image.get('ImageType')).lower() == image_type]
+        index = self.get_overlaid_index(movie_id, image_type, image_tags)
+        kept_tags = image_tags[:index] + image_tags[index + 1:] if index is not None else image_tags
+
+        def deleted():
+            return image_tags[index] not in self.get_image_tags(movie_id, image_type)
+
+        def uploaded():
+            return any(image_tag not in kept_tags for image_tag in self.get_image_tags(movie_id, image_type))
+
+        # Mapped straight from the store, the upload streams it without reading the whole file first
+        image_data = self.originals.load(movie_id, image_type, mapped=True)
+        if image_data is None:
+            logging.error(f"No backup of the {image_type} image of {item['Name']}: {movie_id}, skipping.")
+            return False
+
+        # Define the headers for the request
+        headers = {"X-Emby-Token": self.api_key,
+                   "Content-Type": "image/jpeg"}
+
+        # Define the endpoint URL
+        url = f"{self.server}/Items/{movie_id}/Images/{image_type}"
+
+        with self.metrics.stage('restore_upload'):
+            if image_type == 'backdrop' and index is not None:
+                # An uploaded backdrop is added next to the others, the overlaid one has to go first
+                self.change_image('DELETE', self.image_url(movie_id, image_type, index), deleted,
+                                  headers={"X-Emby-Token": self.api_key})
+                self.state_store.journal(movie_id, image_type, 'restore', 'deleted')
+
+            # Send the POST request
+            success = self.change_image('POST', url, uploaded, headers=headers, data=Base64Reader(image_data))
+
+        # print(response)
+
+        # Check the response
+        if success:
+            logging.info(f'{image_type} image uploaded successfully')
+            self.state_store.journal(movie_id, image_type, 'restore', 'uploaded')
+            return True
+        else:
+            logging.info('Failed to upload image')
+            return False
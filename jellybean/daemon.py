@@ -0,0 +1,125 @@
+import email.parser
+import email.policy
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# Webhook events that never change artwork or media
+ignored_event_prefixes = ('playback.', 'user.', 'session.', 'system.', 'plugins.', 'auth.')
+ignored_events = {'item.rate', 'item.markplayed', 'item.markunplayed'}
+
+
+class EventQueue:
+    """Collects item IDs from webhook events and releases each one after it has been quiet for a while.
+
+    Repeated events for the same item inside the debounce window are coalesced into one.
+    """
+
+    def __init__(self, debounce=10):
+        self.debounce = debounce
+        self._pending = {}
+        self._condition = threading.Condition()
+
+    def add(self, item_ids, delay=None):
+        """Queue item_ids, due once they have been quiet for delay seconds, the debounce by default."""
+        with self._condition:
+            due = time.monotonic() + (self.debounce if delay is None else delay)
+            for item_id in item_ids:
+                self._pending[item_id] = due
+            self._condition.notify()
+
+    def take_due(self, timeout):
+        """Wait up to timeout seconds for items whose debounce expired and return them."""
+        deadline = time.monotonic() + max(timeout, 0)
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                due = [item_id for item_id, due_at in self._pending.items() if due_at <= now]
+                if due:
+                    for item_id in due:
+                        del self._pending[item_id]
+                    return due
+                if now >= deadline:
+                    return []
+                next_due = min(self._pending.values(), default=deadline)
+                self._condition.wait(min(next_due, deadline) - now)
+
+    def __len__(self):
+        with self._condition:
+            return len(self._pending)
+
+
+def multipart_field(body, content_type):
+    """Return the JSON part of a multipart/form-data body, the way Emby's own webhooks send it."""
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body)
+    if not message.is_multipart():
+        return b''
+    parts = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        parts.setdefault(name, part)
+        if part.get_content_type() == 'application/json':
+            parts.setdefault(None, part)
+    part = parts.get('data') or parts.get('payload') or parts.get(None)
+    if part is None:
+        return b''
+    return part.get_payload(decode=True) or b''
+
+
+def parse_event(body, content_type):
+    """Return the item IDs an Emby webhook or notification payload refers to."""
+    data = body
+    try:
+        if content_type.startswith('application/x-www-form-urlencoded'):
+            # Some notification senders wrap the JSON in a form field
+            fields = parse_qs(body.decode('utf-8'))
+            data = (fields.get('data') or fields.get('payload') or [''])[0].encode('utf-8')
+        elif content_type.startswith('multipart/form-data'):
+            data = multipart_field(body, content_type)
+        payload = json.loads(data)
+    except ValueError:
+        logging.warning(f"Could not decode a webhook body of {len(body)} bytes sent as {content_type or 'no content type'}, ignoring it.")
+        return []
+    if not isinstance(payload, dict):
+        return []
+
+    event = str(payload.get('Event') or payload.get('NotificationType') or '').lower()
+    if event in ignored_events or event.startswith(ignored_event_prefixes):
+        return []
+
+    item_ids = []
+    item = payload.get('Item')
+    if isinstance(item, dict) and item.get('Id'):
+        item_ids.append(str(item['Id']))
+    for key in ('ItemId', 'Id'):
+        if payload.get(key):
+            item_ids.append(str(payload[key]))
+    for key in ('ItemIds', 'ItemsAdded', 'ItemsUpdated'):
+        item_ids.extend(str(item_id) for item_id in payload.get(key) or [])
+    return list(dict.fromkeys(item_ids))
+
+
+def start_webhook_server(host, port, queue):
+    """Serve POST requests with webhook payloads on a background thread and feed them into queue."""
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            item_ids = parse_event(body, self.headers.get('Content-Type') or '')
+            if item_ids:
+                logging.info(f"Webhook queued {len(item_ids)} items: {', '.join(item_ids)}")
+                queue.add(item_ids)
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            logging.debug(f"Webhook {self.address_string()}: {format % args}")
+
+    server = ThreadingHTTPServer((host, port), WebhookHandler)
+    threading.Thread(target=server.serve_forever, name='webhook', daemon=True).start()
+    logging.info(f"Listening for webhooks on http://{host}:{server.server_port}")
+    return server
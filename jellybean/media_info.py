@@ -0,0 +1,134 @@
+import re
+
+# Best first, a file gets the first of these any of its video streams qualifies for
+resolution_ranks = ['4KDVHDR', '4KDV', '4KHDRPLUS', '4KHDR', '4KSDR', '1080p']
+
+# Dolby Vision profiles that carry an HDR10 base layer, anything else is Dolby Vision only
+dolby_vision_hdr_profiles = re.compile(r'(?i)profile(7\d?|8[14])|dovi.*hdr10')
+
+dts_x = re.compile(r'\bdts[ :._-]?x\b')
+dts_ma = re.compile(r'\bma\b|master audio|\bxll\b')
+dts_hra = re.compile(r'\bhra?\b|high resolution')
+dts_es = re.compile(r'\bes\b')
+
+
+def is_4k(width):
+    return (width or 0) >= 2500
+
+
+def resolution_from_stream(stream, path=''):
+    if not stream.get('Width'):
+        # Not probed yet
+        return None
+    if not is_4k(stream.get('Width')):
+        return '1080p'
+
+    # Jellyfin sends VideoRangeType, Emby sends ExtendedVideoType and ExtendedVideoSubType
+    range_type = str(stream.get('VideoRangeType') or '').lower()
+    extended_type = str(stream.get('ExtendedVideoType') or '').lower()
+    sub_type = str(stream.get('ExtendedVideoSubType') or '').replace('None', '')
+    if range_type.startswith('dovi') or extended_type == 'dolbyvision':
+        if dolby_vision_hdr_profiles.search(range_type + sub_type):
+            return '4KDVHDR'
+        if range_type or sub_type:
+            return '4KDV'
+        # Nothing says which profile it is, the file name may
+        return '4KDVHDR' if 'HDR' in path else '4KDV'
+    if range_type == 'hdr10plus' or extended_type == 'hdr10plus':
+        return '4KHDRPLUS'
+    if range_type in ('hdr10', 'hlg') or extended_type in ('hdr10', 'hyperloggamma'):
+        return '4KHDR'
+    if str(stream.get('VideoRange') or '').upper() == 'HDR':
+        return '4KHDR'
+    return '4KSDR'
+
+
+def resolution_from_path(path, width):
+    if not is_4k(width):
+        # Placeholder
+        return '1080p'
+    if 'DV' in path:
+        if 'HDR' in path:
+            return '4KDVHDR'
+        return '4KDV'
+    elif 'HDR' in path:
+        if 'HDR10Plus' in path:
+            return '4KHDRPLUS'
+        return '4KHDR'
+    return '4KSDR'
+
+
+def audio_from_stream(stream):
+    codec = str(stream.get('Codec') or '').lower()
+    profile = str(stream.get('Profile') or '').lower()
+    details = ' '.join(str(stream.get(field) or '') for field in ('Profile', 'DisplayTitle', 'Title')).lower()
+    atmos = 'atmos' in details
+
+    if codec == 'truehd':
+        return 'truehd_atmos' if atmos else 'truehd'
+    if codec == 'eac3':
+        return 'plus_atmos' if atmos else 'plus'
+    if codec == 'ac3':
+        return 'dolby_atmos' if atmos else 'digital'
+    if codec in ('dts', 'dca'):
+        if dts_x.search(details):
+            return 'dtsx'
+        # Titles can hold language names, the DTS-HD flavours only come from the profile
+        if dts_ma.search(profile):
+            return 'ma'
+        if dts_hra.search(profile):
+            return 'hra'
+        if dts_es.search(profile):
+            return 'dtses'
+        return 'dts'
+    if codec.startswith('pcm') or codec == 'lpcm':
+        return 'pcm'
+    if codec in ('flac', 'aac', 'mp3', 'opus'):
+        return codec
+    return None
+
+
+class MediaClassifier:
+    """Picks the resolution and audio overlays of a media item from the stream metadata Emby already sent.
+
+    Every video and audio stream of every media source is classified and the best one wins. The
+    path rules are only used when the streams say nothing useful, e.g. items Emby has not probed yet.
+    """
+
+    def __init__(self, audio_classifier):
+        self.audio_classifier = audio_classifier
+        # Audio keys in the order of the rules in audio_codecs.yml, which runs from best to worst
+        self.audio_ranks = [key for key, _ in audio_classifier.rules]
+
+    def classify(self, media_file):
+        """Return (resolution, audio, source) where source says what decided it, 'streams' or 'path'."""
+        streams = [stream for media_source in media_file.get('MediaSources') or []
+                   for stream in media_source.get('MediaStreams') or []]
+        path = self._path(media_file)
+        used_path = False
+
+        resolution = self._best([resolution_from_stream(stream, path) for stream in streams
+                                 if stream.get('Type') == 'Video'], resolution_ranks)
+        if resolution is None:
+            resolution = resolution_from_path(path, media_file.get('Width'))
+            used_path = True
+
+        audio = self._best([audio_from_stream(stream) for stream in streams
+                            if stream.get('Type') == 'Audio'], self.audio_ranks)
+        if audio is None:
+            audio = self.audio_classifier.classify(path)
+            used_path = True
+
+        return resolution, audio, 'path' if used_path else 'streams'
+
+    @staticmethod
+    def _best(keys, ranks):
+        keys = [key for key in keys if key is not None]
+        if not keys:
+            return None
+        return min(keys, key=lambda key: ranks.index(key) if key in ranks else len(ranks))
+
+    @staticmethod
+    def _path(media_file):
+        media_sources = media_file.get('MediaSources') or []
+        return (media_sources[0].get('Path') if media_sources else None) or media_file.get('Path') or ''
@@ -0,0 +1,181 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# Path segments following these are IDs and get folded into one endpoint
+id_segments = re.compile(r'(?<=/(Users|Items|Shows))/[^/]+', re.IGNORECASE)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def prometheus_value(value):
+    return 'NaN' if value is None else value
+
+
+def endpoint_name(method, url):
+    path = id_segments.sub('/{id}', urlparse(url).path.rstrip('/'))
+    return f"{method} {path}"
+
+
+class Metrics:
+    """Per-run timings, HTTP request accounting and counters, summarised at the end of a run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.stages = defaultdict(list)
+            self.requests = defaultdict(lambda: {'count': 0, 'errors': 0, 'bytes_sent': 0,
+                                                 'bytes_received': 0, 'latencies': []})
+            self.counters = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(name, time.perf_counter() - started)
+
+    def record_stage(self, name, seconds):
+        with self._lock:
+            self.stages[name].append(seconds)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def record_response(self, response, *args, **kwargs):
+        """requests response hook, counts the request against its endpoint."""
+        request = response.request
+        endpoint = endpoint_name(request.method, request.url)
+        with self._lock:
+            entry = self.requests[endpoint]
+            entry['count'] += 1
+            entry['errors'] += response.status_code >= 400
+            entry['bytes_sent'] += int(request.headers.get('Content-Length') or 0)
+            entry['bytes_received'] += len(response.content)
+            entry['latencies'].append(response.elapsed.total_seconds())
+        return response
+
+    def summary(self):
+        with self._lock:
+            stages = {name: self._timing(values) for name, values in self.stages.items()}
+            requests = {}
+            for endpoint, entry in self.requests.items():
+                requests[endpoint] = {key: value for key, value in entry.items() if key != 'latencies'}
+                requests[endpoint].update(self._timing(entry['latencies']))
+            return {'started': self.started,
+                    'duration_seconds': round(time.time() - self.started, 3),
+                    'stages': stages,
+                    'requests': requests,
+                    'requests_total': sum(entry['count'] for entry in self.requests.values()),
+                    'bytes_sent_total': sum(entry['bytes_sent'] for entry in self.requests.values()),
+                    'bytes_received_total': sum(entry['bytes_received'] for entry in self.requests.values()),
+                    'counters': dict(self.counters)}
+
+    @staticmethod
+    def _timing(values):
+        return {'count': len(values),
+                'seconds_total': round(sum(values), 6),
+                'p50': percentile(values, 0.5),
+                'p90': percentile(values, 0.9),
+                'p99': percentile(values, 0.99),
+                'max': max(values, default=None)}
+
+    def write_json(self, path, summary=None):
+        write_atomic(path, json.dumps(summary or self.summary(), indent=2))
+
+    def write_prometheus(self, path, summary=None):
+        """Write the summary in the node_exporter textfile collector format."""
+        summary = summary or self.summary()
+        lines = ['# TYPE jellybean_run_duration_seconds gauge',
+                 f"jellybean_run_duration_seconds {summary['duration_seconds']}",
+                 '# TYPE jellybean_run_timestamp_seconds gauge',
+                 f"jellybean_run_timestamp_seconds {summary['started']}",
+                 '# TYPE jellybean_stage_seconds summary']
+        for name, timing in summary['stages'].items():
+            for quantile in ('p50', 'p90', 'p99'):
+                lines.append(f'jellybean_stage_seconds{{stage="{name}",quantile="0.{quantile[1:]}"}} '
+                             f'{prometheus_value(timing[quantile])}')
+            lines.append(f'jellybean_stage_seconds_sum{{stage="{name}"}} {timing["seconds_total"]}')
+            lines.append(f'jellybean_stage_seconds_count{{stage="{name}"}} {timing["count"]}')
+        # Samples of one metric have to stay together in the textfile format
+        for metric, key in (('requests', 'count'), ('errors', 'errors'),
+                            ('bytes_sent', 'bytes_sent'), ('bytes_received', 'bytes_received')):
+            lines.append(f'# TYPE jellybean_http_{metric}_total counter')
+            for endpoint, entry in summary['requests'].items():
+                lines.append(f'jellybean_http_{metric}_total{{endpoint="{endpoint}"}} {entry[key]}')
+        lines.append('# TYPE jellybean_http_request_seconds summary')
+        for endpoint, entry in summary['requests'].items():
+            for quantile in ('p50', 'p90', 'p99'):
+                lines.append(f'jellybean_http_request_seconds{{endpoint="{endpoint}",quantile="0.{quantile[1:]}"}} '
+                             f'{prometheus_value(entry[quantile])}')
+            lines.append(f'jellybean_http_request_seconds_sum{{endpoint="{endpoint}"}} {entry["seconds_total"]}')
+            lines.append(f'jellybean_http_request_seconds_count{{endpoint="{endpoint}"}} {entry["count"]}')
+        lines.append('# TYPE jellybean_events_total counter')
+        for name, value in summary['counters'].items():
+            lines.append(f'jellybean_events_total{{event="{name}"}} {value}')
+        write_atomic(path, '\n'.join(lines) + '\n')
+
+
+def merge_summaries(summaries):
+    """Combine the reports of shards that ran side by side into one.
+
+    Counts, totals and bytes add up. The raw samples stay with each shard, so a merged percentile
+    is the highest one any shard reported, an upper bound rather than the exact value.
+    """
+    def merge_timing(timings):
+        merged = {'count': sum(timing['count'] for timing in timings),
+                  'seconds_total': round(sum(timing['seconds_total'] for timing in timings), 6)}
+        for key in ('p50', 'p90', 'p99', 'max'):
+            merged[key] = max((timing[key] for timing in timings if timing[key] is not None), default=None)
+        return merged
+
+    started = min(summary['started'] for summary in summaries)
+    finished = max(summary['started'] + summary['duration_seconds'] for summary in summaries)
+    stages = defaultdict(list)
+    requests = defaultdict(list)
+    counters = defaultdict(int)
+    for summary in summaries:
+        for name, timing in summary['stages'].items():
+            stages[name].append(timing)
+        for endpoint, entry in summary['requests'].items():
+            requests[endpoint].append(entry)
+        for name, value in summary['counters'].items():
+            counters[name] += value
+
+    merged_requests = {}
+    for endpoint, entries in requests.items():
+        merged_requests[endpoint] = merge_timing(entries)
+        for key in ('errors', 'bytes_sent', 'bytes_received'):
+            merged_requests[endpoint][key] = sum(entry[key] for entry in entries)
+    return {'started': started,
+            'duration_seconds': round(finished - started, 3),
+            'shards': len(summaries),
+            'stages': {name: merge_timing(timings) for name, timings in stages.items()},
+            'requests': merged_requests,
+            'requests_total': sum(summary['requests_total'] for summary in summaries),
+            'bytes_sent_total': sum(summary['bytes_sent_total'] for summary in summaries),
+            'bytes_received_total': sum(summary['bytes_received_total'] for summary in summaries),
+            'counters': dict(counters)}
+
+
+def write_atomic(path, text):
+    # The textfile collector may read at any moment, never let it see half a file
+    with open(f'{path}.tmp', 'w') as file:
+        file.write(text)
+    os.replace(f'{path}.tmp', path)
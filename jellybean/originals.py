@@ -0,0 +1,235 @@
+import hashlib
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+# Original image folders used before the store existed
+legacy_image_types = ('primary', 'thumb', 'backdrop')
+
+# Blobs are only stored compressed when that saves at least this share, JPEGs hardly ever qualify
+min_compression_saving = 0.05
+
+# Unreferenced blobs younger than this are left alone by the garbage collector
+gc_grace_seconds = 60 * 60
+
+
+class OriginalsStore:
+    """Content addressed store for the original artwork overlays are made from.
+
+    Each distinct image is kept once under blobs/ by its sha256, whatever item and image type it
+    belongs to. The index table in the state database maps (item_id, image_type) to a blob. Saving
+    and removing run in SQLite write transactions, which shut out every other thread and shard
+    process, so a blob is never deleted while another item is being pointed at it.
+    """
+
+    def __init__(self, root='./assets/originals', index_path='jellybean.db'):
+        self.root = root
+        self.blob_root = os.path.join(root, 'blobs')
+        self.deduplicated = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(index_path, timeout=60, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS originals (
+                item_id TEXT NOT NULL,
+                image_type TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                size INTEGER,
+                compressed INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL,
+                PRIMARY KEY (item_id, image_type)
+            )
+        """)
+        self._connection.execute("CREATE INDEX IF NOT EXISTS originals_digest ON originals (digest)")
+        self._connection.commit()
+        os.makedirs(self.blob_root, exist_ok=True)
+
+    def has(self, item_id, image_type):
+        return self._row(item_id, image_type) is not None
+
+    def digest(self, item_id, image_type):
+        """Return the sha256 the original of an image is stored under, or None."""
+        row = self._row(item_id, image_type)
+        return row[0] if row is not None else None
+
+    def image_types(self, item_id):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT image_type FROM originals WHERE item_id = ?", (item_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def save(self, item_id, image_type, data):
+        """Store data as the original of an image, durably on disk before it is indexed. Returns its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._write_transaction():
+            stored = self._connection.execute(
+                "SELECT compressed FROM originals WHERE digest = ? LIMIT 1", (digest,)).fetchone()
+            if stored is not None and os.path.exists(self._blob_path(digest, stored[0])):
+                compressed = stored[0]
+                self.deduplicated += 1
+            else:
+                compressed = self._write_blob(digest, data)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO originals (item_id, image_type, digest, size, compressed, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (item_id, image_type, digest, len(data), compressed, time.time()))
+        return digest
+
+    def load(self, item_id, image_type, mapped=False):
+        """Return the original of an image or None.
+
+        With mapped=True an uncompressed blob comes back as a read only mmap, so uploading it never
+        copies the file into memory. The mapping is released once the last reference goes away.
+        """
+        row = self._row(item_id, image_type)
+        if row is None:
+            return None
+        digest, compressed = row
+        try:
+            with open(self._blob_path(digest, compressed), 'rb') as file:
+                if compressed:
+                    return zlib.decompress(file.read())
+                if mapped:
+                    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                return file.read()
+        except FileNotFoundError:
+            logging.error(f"The original {image_type} image of {item_id} is indexed but its blob {digest} is missing.")
+            return None
+
+    def remove(self, item_id, image_type):
+        """Drop an image from the index, and its blob when nothing else uses it."""
+        with self._write_transaction():
+            row = self._connection.execute(
+                "SELECT digest, compressed FROM originals WHERE item_id = ? AND image_type = ?",
+                (item_id, image_type)).fetchone()
+            if row is None:
+                return
+            self._connection.execute(
+                "DELETE FROM originals WHERE item_id = ? AND image_type = ?", (item_id, image_type))
+            if self._referenced(row[0]):
+                return
+        # Only once the delete is committed, and under a second write transaction so that no saver
+        # can point a row at the blob between the check and the unlink. A crash in between leaves
+        # an unreferenced blob for collect_garbage()
+        with self._write_transaction():
+            if self._referenced(row[0]):
+                return
+            try:
+                os.remove(self._blob_path(*row))
+            except FileNotFoundError:
+                pass
+
+    def migrate(self):
+        """Move backups from the old {primary,thumb,backdrop}/{item_id}.jpg layout into the store."""
+        moved = 0
+        for image_type in legacy_image_types:
+            folder = os.path.join(self.root, image_type)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if not name.endswith('.jpg'):
+                    # Half written backups from an interrupted run
+                    if name.endswith('.part'):
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+                    continue
+                item_id = name[:-len('.jpg')]
+                try:
+                    if not self.has(item_id, image_type):
+                        with open(path, 'rb') as file:
+                            self.save(item_id, image_type, file.read())
+                    # Only removed once the copy in the store is indexed
+                    os.remove(path)
+                except FileNotFoundError:
+                    # Another shard got to it first
+                    continue
+                moved += 1
+            try:
+                if not os.listdir(folder):
+                    os.rmdir(folder)
+            except OSError:
+                pass
+        if moved:
+            logging.info(f"Moved {moved} original images into the content addressed store.")
+        return moved
+
+    def collect_garbage(self, grace_seconds=gc_grace_seconds):
+        """Delete blobs no index row points at and leftover temporary files. Returns (files, bytes) removed."""
+        with self._lock:
+            referenced = {self._blob_path(digest, compressed) for digest, compressed in
+                          self._connection.execute("SELECT DISTINCT digest, compressed FROM originals")}
+        cutoff = time.time() - grace_seconds
+        removed = freed = 0
+        for folder, _, names in os.walk(self.blob_root):
+            for name in names:
+                path = os.path.join(folder, name)
+                if path in referenced:
+                    continue
+                try:
+                    stat = os.stat(path)
+                    if stat.st_mtime > cutoff:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                freed += stat.st_size
+            if folder != self.blob_root and not os.listdir(folder):
+                try:
+                    os.rmdir(folder)
+                except OSError:
+                    # A blob was written into it meanwhile
+                    pass
+        return removed, freed
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    @contextmanager
+    def _write_transaction(self):
+        # BEGIN IMMEDIATE takes the database write lock up front, the other shards wait for it up to the timeout
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._connection.rollback()
+                raise
+            self._connection.commit()
+
+    def _referenced(self, digest):
+        return self._connection.execute(
+            "SELECT 1 FROM originals WHERE digest = ? LIMIT 1", (digest,)).fetchone() is not None
+
+    def _row(self, item_id, image_type):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT digest, compressed FROM originals WHERE item_id = ? AND image_type = ?",
+                (item_id, image_type)).fetchone()
+
+    def _blob_path(self, digest, compressed):
+        return os.path.join(self.blob_root, digest[:2], digest + ('.z' if compressed else ''))
+
+    def _write_blob(self, digest, data):
+        packed = zlib.compress(data, 6)
+        compressed = len(packed) <= len(data) * (1 - min_compression_saving)
+        path = self._blob_path(digest, compressed)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A temporary name keeps a crash from leaving half a blob behind, and shards from writing into each other's
+        temporary_path = f"{path}.{os.getpid()}.part"
+        with open(temporary_path, "wb") as file:
+            file.write(packed if compressed else data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, path)
+        return int(compressed)
@@ -0,0 +1,174 @@
+import io
+import logging
+import threading
+import time
+
+from PIL import Image, ImageDraw, JpegImagePlugin, features
+
+# Canvas size and badge layout per image type: background padding, corner radius,
+# icon offset inside the background and where the resolution badge goes on the canvas
+image_layouts = {
+    'primary': {'size': (1000, 1500), 'padding': 50, 'radius': 25, 'icon_offset': (25, 20), 'position': (25, 50)},
+    'thumb': {'size': (1000, 562), 'padding': 20, 'radius': 15, 'icon_offset': (10, 10), 'position': (25, 30)},
+    'backdrop': {'size': (3840, 2160), 'padding': 76, 'radius': 50, 'icon_offset': (40, 33), 'position': (95, 121)},
+}
+badge_background_color = (0, 0, 0, 160)
+
+# Encoder settings per image type, overridden by the output section of config.yaml. These are Pillow's defaults
+default_output_profile = {'format': 'jpeg', 'quality': 75, 'progressive': False, 'optimize': False,
+                          'subsampling': None, 'max_dimension': None, 'guard': False}
+output_formats = {'jpeg': ('JPEG', 'image/jpeg'), 'webp': ('WEBP', 'image/webp')}
+subsampling_modes = {'4:4:4': 0, '4:2:2': 1, '4:2:0': 2}
+
+# Luminance table of the JPEG standard, libjpeg scales it by the quality setting
+standard_luminance_table = [16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55,
+                            14, 13, 16, 24, 40, 57, 69, 56, 14, 17, 22, 29, 51, 87, 80, 62,
+                            18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+                            49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99]
+
+# Finished badges keyed by (image type, resolution overlay, audio overlay, scale)
+badge_cache = {}
+badge_lock = threading.Lock()
+
+
+def get_output_profiles(output_config):
+    """Output profile per image type from the output section of config.yaml, unset values keep the defaults."""
+    profiles = {}
+    for image_type in image_layouts:
+        profile = dict(default_output_profile)
+        profile.update((output_config or {}).get(image_type) or {})
+        if profile['format'] not in output_formats:
+            logging.error(f"Invalid output format {profile['format']!r} for {image_type} images in config.yaml, using jpeg.")
+            profile['format'] = 'jpeg'
+        elif profile['format'] == 'webp' and not features.check('webp'):
+            logging.error(f"Pillow was built without WebP support, {image_type} images are saved as jpeg.")
+            profile['format'] = 'jpeg'
+        if profile['subsampling'] is not None and profile['subsampling'] not in subsampling_modes:
+            logging.error(f"Invalid subsampling {profile['subsampling']!r} for {image_type} images in config.yaml, "
+                          f"expected one of {', '.join(subsampling_modes)}.")
+            profile['subsampling'] = None
+        profiles[image_type] = profile
+    return profiles
+
+
+def fit_size(size, max_dimension):
+    """size scaled down so its longest side is at most max_dimension."""
+    if not max_dimension or max(size) <= max_dimension:
+        return tuple(size)
+    factor = max_dimension / max(size)
+    return max(round(size[0] * factor), 1), max(round(size[1] * factor), 1)
+
+
+def estimate_jpeg_quality(image):
+    """Rough libjpeg quality setting a JPEG was saved with, from its luminance table. None for other formats."""
+    tables = getattr(image, 'quantization', None)
+    if not tables or 0 not in tables:
+        return None
+    scale = sum(tables[0]) * 100 / sum(standard_luminance_table)
+    return (200 - scale) / 2 if scale <= 100 else 5000 / scale
+
+
+def get_badges(image_type, resolution_overlay_name, audio_overlay_name, scale=1):
+    """Return the finished badges and their positions for an image type, building them on first use."""
+    key = (image_type, resolution_overlay_name, audio_overlay_name, scale)
+    with badge_lock:
+        if key not in badge_cache:
+            badges = build_badges(image_type, resolution_overlay_name, audio_overlay_name)
+            if scale != 1:
+                badges = [(badge.resize((max(int(badge.width * scale), 1), max(int(badge.height * scale), 1))),
+                           (int(x * scale), int(y * scale))) for badge, (x, y) in badges]
+            badge_cache[key] = badges
+        return badge_cache[key]
+
+
+def composite_badges(image, badges):
+    # Only the area under each badge needs an alpha channel, the rest of the image stays RGB
+    for badge, (x, y) in badges:
+        box = (x, y, x + badge.width, y + badge.height)
+        region = image.crop(box).convert("RGBA")
+        region.alpha_composite(badge)
+        image.paste(region.convert("RGB"), box)
+
+
+def build_badges(image_type, resolution_overlay_name, audio_overlay_name):
+    layout = image_layouts[image_type]
+
+    resolution_overlay_image = Image.open(f'./assets/overlays/resolution/{resolution_overlay_name}.png').convert("RGBA")
+    width, height = resolution_overlay_image.size
+    if image_type == 'thumb':
+        resolution_overlay_image = resolution_overlay_image.resize((int(width / 1.5), int(height / 1.5)))
+    elif image_type == 'backdrop':
+        resolution_overlay_image = resolution_overlay_image.resize((int(width * 2.5637), int(height * 2.5637)))
+
+    badges = [(build_badge(resolution_overlay_image, layout['padding'], layout['radius'], layout['icon_offset']),
+               layout['position'])]
+
+    # Only the poster gets the audio codec, centered and bottom aligned with the resolution badge
+    if image_type == 'primary':
+        audio_overlay_image = Image.open(f'./assets/overlays/audio/{audio_overlay_name}.png').convert("RGBA")
+        audio_x = (layout['size'][0] - audio_overlay_image.width) // 2 - 25
+        audio_y = layout['position'][1] + resolution_overlay_image.height - audio_overlay_image.height
+        badges.append((build_badge(audio_overlay_image, 50, layout['radius'], (25, 20)), (audio_x, audio_y)))
+
+    return badges
+
+
+def build_badge(overlay_image, padding, corner_radius, icon_offset):
+    # Semi-transparent background with rounded corners larger than the overlay image
+    size = (overlay_image.width + padding, overlay_image.height + padding)
+    badge = Image.new("RGBA", size)
+    mask = Image.new("L", size, 0)
+    ImageDraw.Draw(mask).rounded_rectangle([(0, 0), size], corner_radius, fill=255)
+    badge.paste(badge_background_color, mask=mask)
+    badge.alpha_composite(overlay_image, icon_offset)
+    return badge
+
+
+def render_overlay(original_data, image_type, resolution_overlay_name, audio_overlay_name, keep_source_resolution,
+                   profile=None):
+    """Composite the badges onto an encoded original and encode the result with the output profile.
+
+    Returns the encoded bytes, their content type, the seconds spent compositing and encoding and
+    whether the guard kept the size or quality of the source. Raises PIL.UnidentifiedImageError or
+    OSError when the original cannot be decoded. Only takes and returns plain values so it can run
+    in a worker process.
+    """
+    profile = profile or default_output_profile
+    started = time.perf_counter()
+    original_image = Image.open(io.BytesIO(original_data))
+    layout_size = image_layouts[image_type]['size']
+    size = fit_size(original_image.size if keep_source_resolution else layout_size, profile['max_dimension'])
+
+    guarded = (profile['guard'] and original_image.format == 'JPEG'
+               and original_image.width <= size[0] and original_image.height <= size[1])
+    if guarded:
+        # Blowing a smaller source up only adds bytes, it keeps its own size and the badges are scaled
+        size = original_image.size
+    elif size != original_image.size:
+        # Let the JPEG decoder scale down while decoding when the source is larger than the target
+        original_image.draft('RGB', size)
+    original_image.load()
+
+    composite_image = original_image.convert("RGB")
+    if composite_image.size != size:
+        composite_image = composite_image.resize(size)
+    scale = round(size[0] / layout_size[0], 2)
+
+    composite_badges(composite_image, get_badges(image_type, resolution_overlay_name, audio_overlay_name, scale))
+
+    encode_started = time.perf_counter()
+    output_format, content_type = output_formats[profile['format']]
+    options = {'quality': profile['quality'], 'optimize': profile['optimize']}
+    if output_format == 'JPEG':
+        options['progressive'] = profile['progressive']
+        if profile['subsampling'] is not None:
+            options['subsampling'] = subsampling_modes[profile['subsampling']]
+        if guarded and (estimate_jpeg_quality(original_image) or 100) < profile['quality']:
+            # Encoding above the quality of the source only spends bytes on its artifacts, reuse its tables
+            del options['quality']
+            options['qtables'] = original_image.quantization
+            options['subsampling'] = JpegImagePlugin.get_sampling(original_image)
+    output = io.BytesIO()
+    composite_image.save(output, output_format, **options)
+    timings = {'composite': encode_started - started, 'encode': time.perf_counter() - encode_started}
+    return output.getvalue(), content_type, timings, guarded
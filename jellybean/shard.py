@@ -0,0 +1,40 @@
+import hashlib
+
+
+class Shard:
+    """One of count slices of every library, numbered from 1.
+
+    Items are assigned by a hash of their ID, so every process and host that runs with the same
+    count agrees on the split without talking to the others. Seasons and episodes follow their
+    series, so a show is always handled by one shard.
+    """
+
+    def __init__(self, index, count):
+        if not 1 <= index <= count:
+            raise ValueError(f"Shard {index}/{count} is out of range, shards are numbered 1 to {count}.")
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def parse(cls, text):
+        """Build a shard from 'i/N'."""
+        try:
+            index, count = (int(part) for part in text.split('/'))
+        except ValueError:
+            raise ValueError(f"Invalid shard {text!r}, expected i/N, e.g. 1/4.")
+        return cls(index, count)
+
+    def owns(self, item):
+        key = item.get('SeriesId') or item['Id']
+        digest = hashlib.sha1(key.encode()).digest()
+        return int.from_bytes(digest[:8], 'big') % self.count == self.index - 1
+
+    def suffix(self, path):
+        """path with the shard in its name, e.g. jellybean-report.json to jellybean-report.shard-1-of-4.json."""
+        root, dot, extension = path.rpartition('.')
+        if not dot or '/' in extension:
+            return f"{path}.shard-{self.index}-of-{self.count}"
+        return f"{root}.shard-{self.index}-of-{self.count}.{extension}"
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
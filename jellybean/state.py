@@ -0,0 +1,156 @@
+import sqlite3
+import threading
+import time
+
+
+class StateStore:
+    """Remembers what was overlaid on each item image between runs.
+
+    One row per item and image type with the Emby image tag left after our upload, the
+    resolution/audio classification, the overlay signature and the checksum of the original.
+
+    The journal table holds the steps of items still being changed on the server, one row per
+    item and image type plus an item row with an empty image type. Rows are removed once the item
+    is finished, so anything left at startup was interrupted. The completed table lists the items
+    a library pass has finished, so an interrupted pass can carry on where it stopped.
+    """
+
+    def __init__(self, path='jellybean.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        # Shards run as separate processes on the same database, writers wait their turn instead of failing
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS overlays (
+                item_id TEXT NOT NULL,
+                image_type TEXT NOT NULL,
+                image_tag TEXT,
+                resolution TEXT,
+                audio TEXT,
+                signature TEXT,
+                original_checksum TEXT,
+                updated_at REAL,
+                PRIMARY KEY (item_id, image_type)
+            )
+        """)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS journal (
+                item_id TEXT NOT NULL,
+                image_type TEXT NOT NULL,
+                action TEXT NOT NULL,
+                step TEXT NOT NULL,
+                source TEXT,
+                updated_at REAL,
+                PRIMARY KEY (item_id, image_type)
+            )
+        """)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS completed (
+                library TEXT NOT NULL,
+                action TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                PRIMARY KEY (library, item_id)
+            )
+        """)
+        self._connection.commit()
+
+    def get(self, item_id):
+        """Return the rows recorded for an item as {image_type: row}."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT image_type, image_tag, resolution, audio, signature, original_checksum "
+                "FROM overlays WHERE item_id = ?", (item_id,)).fetchall()
+        return {row[0]: {'image_tag': row[1],
+                         'resolution': row[2],
+                         'audio': row[3],
+                         'signature': row[4],
+                         'original_checksum': row[5]} for row in rows}
+
+    def record(self, item_id, image_type, image_tag, resolution, audio, signature, original_checksum):
+        with self._lock:
+            # A missing checksum keeps the one already recorded for the backup
+            self._connection.execute(
+                "INSERT INTO overlays "
+                "(item_id, image_type, image_tag, resolution, audio, signature, original_checksum, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (item_id, image_type) DO UPDATE SET "
+                "image_tag = excluded.image_tag, resolution = excluded.resolution, audio = excluded.audio, "
+                "signature = excluded.signature, updated_at = excluded.updated_at, "
+                "original_checksum = COALESCE(excluded.original_checksum, overlays.original_checksum)",
+                (item_id, image_type, image_tag, resolution, audio, signature, original_checksum, time.time()))
+            self._connection.commit()
+
+    def forget(self, item_id):
+        with self._lock:
+            self._connection.execute("DELETE FROM overlays WHERE item_id = ?", (item_id,))
+            self._connection.commit()
+
+    def journal(self, item_id, image_type, action, step, source=None):
+        """Record the latest step reached for an image, or for the whole item when image_type is ''."""
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO journal (item_id, image_type, action, step, source, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (item_id, image_type) DO UPDATE SET "
+                "action = excluded.action, step = excluded.step, updated_at = excluded.updated_at, "
+                "source = COALESCE(excluded.source, journal.source)",
+                (item_id, image_type, action, step, source, time.time()))
+            self._connection.commit()
+
+    def unfinished(self):
+        """Return the journal of interrupted items as {item_id: {'action': action, 'images': {image_type: row}}}."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT item_id, image_type, action, step, source FROM journal ORDER BY updated_at").fetchall()
+        return self._entries(rows)
+
+    def unfinished_item(self, item_id):
+        """Return the journal entry of one item as unfinished() has it, or None."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT item_id, image_type, action, step, source FROM journal WHERE item_id = ? "
+                "ORDER BY updated_at", (item_id,)).fetchall()
+        return self._entries(rows).get(item_id)
+
+    @staticmethod
+    def _entries(rows):
+        items = {}
+        for item_id, image_type, action, step, source in rows:
+            entry = items.setdefault(item_id, {'action': action, 'images': {}})
+            if image_type:
+                entry['images'][image_type] = {'step': step, 'source': source}
+            else:
+                entry['action'] = action
+        return items
+
+    def finish(self, item_id):
+        with self._lock:
+            self._connection.execute("DELETE FROM journal WHERE item_id = ?", (item_id,))
+            self._connection.commit()
+
+    def completed(self, library, action):
+        """Item IDs an interrupted pass over library already finished, when it was doing the same action."""
+        with self._lock:
+            self._connection.execute("DELETE FROM completed WHERE library = ? AND action != ?", (library, action))
+            self._connection.commit()
+            rows = self._connection.execute(
+                "SELECT item_id FROM completed WHERE library = ?", (library,)).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_completed(self, library, action, item_id):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO completed (library, action, item_id) VALUES (?, ?, ?)",
+                (library, action, item_id))
+            self._connection.commit()
+
+    def clear_completed(self, library):
+        with self._lock:
+            self._connection.execute("DELETE FROM completed WHERE library = ?", (library,))
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
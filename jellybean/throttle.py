@@ -0,0 +1,203 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError
+
+from .metrics import endpoint_name
+
+# Responses worth another attempt, everything else goes straight back to the caller
+retry_statuses = {429, 500, 502, 503, 504}
+# Responses that mean the server is struggling and should get fewer requests
+overload_statuses = {429, 502, 503, 504}
+# Methods that can be sent again whatever became of the first attempt
+idempotent_methods = {'GET', 'HEAD', 'OPTIONS', 'PUT'}
+# Responses that say a request changing something was turned away before Emby acted on it
+rejected_statuses = {429, 503}
+# Responses after which a request changing something may or may not have been carried out
+uncertain_statuses = {500, 502, 504}
+
+
+def failed_to_connect(error):
+    """Whether a request failed before a connection was made, so none of it can have reached the server."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # Refused or unresolvable connections come wrapped in a MaxRetryError, a NewConnectionError is a ConnectTimeoutError
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, ConnectTimeoutError)
+
+
+def retry_after_seconds(response):
+    """Seconds asked for in a Retry-After header, which holds either a number or an HTTP date."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """Caps the requests in flight, the request rate, and stops everyone while the server asks for a pause.
+
+    The cap follows additive increase, multiplicative decrease. Every healthy response raises it by
+    about one per round of requests up to maximum. Overload responses, connection failures and
+    latency climbing well above its usual level for that endpoint cut it down to minimum at worst.
+    Threads over the cap wait, which holds the item workers back as well.
+    """
+
+    def __init__(self, maximum, minimum=1, requests_per_second=0, adaptive=True,
+                 latency_tolerance=2.0, latency_floor=0.1, cooldown=1.0):
+        self.maximum = max(int(maximum), 1)
+        self.minimum = min(max(int(minimum), 1), self.maximum)
+        self.limit = float(self.maximum)
+        self.adaptive = adaptive
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.latency_tolerance = latency_tolerance
+        # Slow downs smaller than this are noise, not congestion
+        self.latency_floor = latency_floor
+        # Only one decrease per cooldown, responses already in flight report the same congestion
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.decreases = 0
+        self._latency = {}
+        self._paused_until = 0.0
+        self._next_slot = 0.0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def pause(self, seconds):
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    self._condition.wait(self._paused_until - now)
+                elif self.in_flight >= int(self.limit):
+                    self._condition.wait()
+                else:
+                    break
+            self.in_flight += 1
+            # Requests are spaced evenly instead of bursting at the start of every second
+            slot = max(self._next_slot, time.monotonic())
+            self._next_slot = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(self, endpoint, seconds, overloaded):
+        with self._condition:
+            self.in_flight -= 1
+            if self.adaptive:
+                if overloaded or self._slow(endpoint, seconds):
+                    self._decrease(0.5 if overloaded else 0.8)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def _slow(self, endpoint, seconds):
+        # A fast and a slow moving average of each endpoint's latency, uploads are never compared to lookups
+        recent, usual = self._latency.get(endpoint, (seconds, seconds))
+        recent += (seconds - recent) * 0.3
+        usual += (seconds - usual) * 0.02
+        self._latency[endpoint] = (recent, usual)
+        return recent > usual * self.latency_tolerance and recent - usual > self.latency_floor
+
+    def _decrease(self, factor):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        limit = max(self.minimum, self.limit * factor)
+        if int(limit) < int(self.limit):
+            logging.info(f"Emby is under load, lowering requests in flight to {int(limit)}")
+            self.decreases += 1
+        self.limit = limit
+
+
+class ThrottledSession(requests.Session):
+    """A session that retries transient failures with jittered exponential backoff and goes through a limiter.
+
+    Timeouts, connection errors, 429 and 5xx responses are tried again up to retries times. A
+    Retry-After header replaces the backoff and pauses every thread, not just the one that got it.
+    The last failed response is returned as is, the last exception is raised.
+
+    POST and DELETE are only tried again when the request never got to Emby: failures to connect,
+    429 and 503. After a read timeout or another 5xx Emby may have done it already, so the response
+    or exception goes back to the caller to check, unless the request says it is idempotent.
+    """
+
+    def __init__(self, limiter=None, retries=5, backoff=1.0, max_backoff=60.0, timeout=60):
+        super().__init__()
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.retried = 0
+        self._retry_lock = threading.Lock()
+
+    def request(self, method, url, *args, idempotent=None, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = endpoint_name(method, url)
+        if idempotent is None:
+            idempotent = method.upper() in idempotent_methods
+        statuses = retry_statuses if idempotent else rejected_statuses
+        attempt = 0
+        while True:
+            if self.limiter:
+                self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if self.limiter:
+                    self.limiter.release(endpoint, time.monotonic() - started, True)
+                # A dropped connection or a read timeout leaves it open whether Emby got the request
+                if attempt >= self.retries or not (idempotent or failed_to_connect(error)):
+                    raise
+                delay = self.backoff_delay(attempt)
+                logging.warning(f"{method} {url} failed ({error.__class__.__name__}), retrying in {delay:.1f}s")
+            except Exception:
+                if self.limiter:
+                    self.limiter.release(endpoint, time.monotonic() - started, False)
+                raise
+            else:
+                if self.limiter:
+                    self.limiter.release(endpoint, time.monotonic() - started,
+                                         response.status_code in overload_statuses)
+                if response.status_code not in statuses or attempt >= self.retries:
+                    return response
+                delay = retry_after_seconds(response)
+                if delay is not None:
+                    delay = min(delay, self.max_backoff)
+                    if self.limiter:
+                        self.limiter.pause(delay)
+                else:
+                    delay = self.backoff_delay(attempt)
+                logging.warning(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+                response.close()
+
+            attempt += 1
+            with self._retry_lock:
+                self.retried += 1
+            time.sleep(delay)
+            # Streamed bodies have to be read again from the start
+            data = kwargs.get('data')
+            if hasattr(data, 'seek'):
+                data.seek(0)
+
+    def backoff_delay(self, attempt):
+        # Full jitter keeps the workers that failed together from retrying together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))